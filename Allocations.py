@@ -1,22 +1,112 @@
+import time
+SCRIPT_START = time.perf_counter()
 import streamlit as st
+import os
+import json
+import uuid
+import logging
+import functools
 import requests
 import pandas as pd
-import numpy as np
-import wbgapi as wb
-import plotly.express as px
-import plotly.graph_objects as go
-from streamlit_lottie import st_lottie
-from datetime import date
-from sklearn.cluster import KMeans
-from kneed import KneeLocator
+import allocations_engine as engine
+from allocations_engine import Importing, metrics
+# Plotly, streamlit_lottie and the clustering stack (sklearn, kneed, joblib) are imported on first use via Importing()
+CORE_IMPORT_TIME = time.perf_counter() - SCRIPT_START
+
+# Sessions share the model tables of the engine's store; with copy-on-write what they derive from them
+# shares buffers until written to, and pandas writes copy instead of reaching the shared tables
+pd.options.mode.copy_on_write = True
 
 # emojis list: https://www.webfx.com/tools/emoji-cheat-sheet/
 st.set_page_config(page_title="TGF Allocations API", page_icon="🎗", layout="wide")
 
+# Startup profile (GF_STARTUP_PROFILE=1): import and first-render times, shown in the sidebar and logged
+STARTUP_PROFILE = os.environ.get('GF_STARTUP_PROFILE') == '1'
+logger = logging.getLogger("allocations")
+
+engine.STARTUP_PROFILE['imports'].setdefault('streamlit, pandas, requests, allocations_engine', CORE_IMPORT_TIME)
+
+# Diagnostics sidebar (GF_DIAGNOSTICS=1 or ?diagnostics=1): stage timings, HTTP transfer, cache hits and memory
+DIAGNOSTICS = os.environ.get('GF_DIAGNOSTICS') == '1' or st.query_params.get('diagnostics') == '1'
+metrics.Starting_run()
+
+def Instrumented(name):
+    # Times a st.cache_* function and counts its hits and misses; its body calls metrics.Marking_miss()
+    def decorator(cached_function):
+        @functools.wraps(cached_function)
+        def wrapper(*args, **kwargs):
+            metrics.Expecting_cached(name)
+            try:
+                with metrics.Timing(name):
+                    return cached_function(*args, **kwargs)
+            finally:
+                metrics.Finishing_cached()
+        wrapper.clear = cached_function.clear
+        return wrapper
+    return decorator
+
+def Plotting(name, figure, **kwargs):
+    # st.plotly_chart serializes the figure, which is a large part of its cost
+    with metrics.Timing('plotly_chart ' + name):
+        st.plotly_chart(figure, **kwargs)
+
+def Reporting_diagnostics():
+    if not DIAGNOSTICS:
+        return
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        st.caption("This run")
+        st.dataframe(pd.DataFrame(metrics.Run_events()), hide_index=True)
+        with metrics.METRICS_LOCK:
+            caches = pd.DataFrame.from_dict(metrics.CACHES, orient='index')
+            http = pd.DataFrame.from_dict(metrics.HTTP, orient='index')
+            stages = pd.DataFrame.from_dict(metrics.STAGES, orient='index')
+            memory = pd.Series(metrics.MEMORY, name='bytes', dtype='int64')
+        with engine.BREAKERS_LOCK:
+            breakers = pd.DataFrame.from_dict(engine.BREAKERS, orient='index')
+        if not caches.empty:
+            caches['hit ratio'] = caches['hits'] / (caches['hits'] + caches['misses'])
+        st.caption("Cache hits (since process start)")
+        st.dataframe(caches)
+        st.caption("HTTP by endpoint, with latency histogram (since process start)")
+        st.dataframe(http)
+        st.caption("Circuit breakers by host")
+        st.dataframe(breakers)
+        st.caption("Stages (since process start)")
+        st.dataframe(stages)
+        st.caption("DataFrame memory")
+        st.dataframe(memory)
+
+def Reporting_startup_profile(page):
+    profile = engine.STARTUP_PROFILE
+    if page not in profile['renders']:
+        profile['renders'][page] = time.perf_counter() - SCRIPT_START
+        if STARTUP_PROFILE:
+            logger.info("startup profile: %s", json.dumps(profile))
+    if STARTUP_PROFILE:
+        with st.sidebar.expander("Startup profile"):
+            st.dataframe(pd.DataFrame(
+                [('import', name, seconds) for name, seconds in profile['imports'].items()] +
+                [('first render', name, seconds) for name, seconds in profile['renders'].items()],
+                columns=['stage', 'name', 'seconds']
+            ), hide_index=True)
+
+# Static assets shipped with the app, read from disk once per process and kept in memory
+ASSET_FILES = ['style/style.css', 'style/wave.css', 'Images/lottie_loading.json']
+
+@st.cache_resource(show_spinner=False)
+def Loading_assets():
+    assets = {}
+    for path in ASSET_FILES:
+        try:
+            with open(path) as f:
+                assets[path] = json.load(f) if path.endswith('.json') else f.read()
+        except (OSError, ValueError):
+            assets[path] = None
+    return assets
+
 # Use local CSS
 def local_css(file_name):
-    with open(file_name) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+    st.markdown(f"<style>{Loading_assets()[file_name]}</style>", unsafe_allow_html=True)
 local_css("style/style.css")
 
 # Remove whitespace from the top of the page and sidebar
@@ -59,12 +149,66 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@Instrumented('load_lottieurl')
+@st.cache_data(show_spinner=False)
 def load_lottieurl(url: str):
-    r = requests.get(url)
+    metrics.Marking_miss()
+    try:
+        r = engine.Requesting(API_session(), url, timeout=(3.05, 5), retries=1)
+    except requests.RequestException:
+        return None
     if r.status_code != 200:
         return None
     return r.json()
 
+def load_lottie(path, fallback_url=None):
+    # Bundled animation first; the remote copy is only fetched if the file is missing
+    lottie_json = Loading_assets().get(path)
+    if lottie_json is None and fallback_url:
+        lottie_json = load_lottieurl(fallback_url)
+    return lottie_json
+
+@st.cache_resource(show_spinner=False)
+def API_session():
+    # Keep-alive connection pools shared by every loader and every session
+    return engine.Creating_session()
+
+API_STATUS_URL = "https://data-service.theglobalfund.org/v3.3/odata/VGrantAgreementImplementationPeriods"
+
+@Instrumented('API_status')
+@st.cache_data(show_spinner=False, ttl=60)
+def API_status():
+    # One row with a strict timeout and no retry is enough to know the API answers; shared by all sessions for a minute
+    metrics.Marking_miss()
+    try:
+        return engine.Requesting(API_session(), API_STATUS_URL, params={'$top': 1}, timeout=(3.05, 5), retries=0).status_code
+    except requests.RequestException:
+        return None
+
+SNAPSHOT_TTL = engine.SNAPSHOT_TTL
+
+@st.cache_resource(show_spinner=False)
+def Data_store():
+    # One read-only store per process: every session gets the same model tables, not a copy of them
+    return engine.SharedStore(max_entries=8, ttl=SNAPSHOT_TTL)
+
+@st.cache_resource(show_spinner=False)
+def Query_service():
+    # Local Arrow/JSON endpoint over the same store (GF_QUERY_PORT), started once per process
+    try:
+        server = engine.Serving(Data_store(), API_session(), SNAPSHOT_TTL)
+    except OSError as error:
+        # e.g. the port is taken by another app process; the app itself carries on
+        logger.warning("query service not started: %s", error)
+        return None
+    logger.info("query service listening on %s:%s", *server.server_address[:2])
+    return server
+
+# The service comes up with the app process, not with the first visitor past the landing page;
+# it builds the model on its first query
+if engine.QUERY_PORT:
+    Query_service()
+
 # Landing page
 
 if 'count' not in st.session_state:
@@ -83,9 +227,9 @@ if st.session_state.count == 0:
                    " The data is also grouped by Region, Income level, or Country (using the World Bank API) depending "
                  "on the user's selection.",unsafe_allow_html=True)
         lottie_url = "https://lottie.host/285a7a0c-1d81-4a8f-9df5-c5bebaae5663/UDqNAwwYUo.json"
-        lottie_json = load_lottieurl(lottie_url)
+        lottie_json = load_lottie("Images/lottie_loading.json", fallback_url=lottie_url)
         with col2:
-            st_lottie(lottie_json, height=150, key="loading_gif2")
+            Importing('streamlit_lottie').st_lottie(lottie_json, height=150, key="loading_gif2")
 
         with st.expander("Read more about the Global Fund (TGF), what is an API and how to access TGF API"):
             col1, col2, col3 = st.columns([1, 1, 1], gap='small')
@@ -121,17 +265,16 @@ if st.session_state.count == 0:
         col1, col2 = st.columns([10, 35], gap='small')
         col1.subheader("API status")
 
-        url2 = "https://data-service.theglobalfund.org/v3.3/odata/VGrantAgreementImplementationPeriods"
-        response1 = requests.get(url2)
-        if response1.status_code != 200:
-            col2.warning( "There seems to be an error with the Global Fund API (status code: {})".format(response1.status_code))
+        status_code = API_status()
+        if status_code != 200:
+            col2.warning( "There seems to be an error with the Global Fund API (status code: {})".format(status_code or "no response"))
             col2.markdown("<p style='text-align: justify;font-size: 18px;'>"
-                        "The API is currently unavailable (see <a href='https://data-service.theglobalfund.org/v3.3/odata/VGrantAgreementImplementationPeriods'> this link </a> )".format(response1.status_code)
+                        "The API is currently unavailable (see <a href='{}'> this link </a> )".format(API_STATUS_URL)
                         ,unsafe_allow_html=True)
         else:
             col2.success("Connection to the Global Fund API established successfully")
 
-        if response1.status_code != 200 :
+        if status_code != 200 :
             col2.info("This app will be accessible once the connection is back")
 
         col1, col2 = st.columns([10, 35], gap='small')
@@ -141,7 +284,7 @@ if st.session_state.count == 0:
             "should not be taken as an official representation of the Global Fund."
             "<br>For accurate and up-to-date information, please consult the Global Fund official data explorer.",
             unsafe_allow_html=True)
-        if response1.status_code == 200:
+        if status_code == 200:
             disclaimer_confirmation = col2.button('I understand')
             if disclaimer_confirmation:
                 st.session_state.count = 1
@@ -149,39 +292,8 @@ if st.session_state.count == 0:
 
 if st.session_state.count >= 1:
 
-    # Use local CSS for background waves
-    with open('./style/wave.css') as f:
-        css = f.read()
-    st.markdown(f'<style>{css}</style>', unsafe_allow_html=True)
-
-    # Remove whitespace from the top of the page and sidebar
-    st.markdown("""
-        <style>
-            .block-container {
-                padding-top: 1rem;
-                padding-bottom: 0rem
-            }
-        </style>
-    """, unsafe_allow_html=True)
-
-    st.markdown("""
-    <style>
-    div[data-testid="metric-container"] {
-    background-color: #12151D;
-    border: 1px solid #283648 ;
-    border-radius: 5px;
-    padding: 1% 1% 1% 5%;
-    color: #04AA6D;
-    overflow-wrap: break-word;
-    }
-    /* breakline for metric text         */
-    div[data-testid="metric-container"] > label[data-testid="stMetricLabel"] > div {
-    overflow-wrap: break-word;
-    white-space: break-spaces;
-    color: white;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    # Use local CSS for background waves (the block-container and metric styles are already injected above)
+    local_css('style/wave.css')
 
     header_space = st.container()
     with header_space:
@@ -198,140 +310,28 @@ if st.session_state.count >= 1:
             "<span style='color:grey'>Loading takes a few seconds the first time.</span> </p>",
             unsafe_allow_html=True)
 
-    @st.cache_data(show_spinner=False)
-    def Loading_API_Allocations():
-        service_url0 = 'https://api-gf-api-gf-02.azurewebsites.net/v3.3/odata/Allocations'
-        response0 = requests.get(service_url0)
-        if response0.ok:
-            data0j = response0.json()
-            df_allocations = pd.DataFrame(data0j["value"])
-            columns_to_keep = [
-                'allocationId',
-                'geographicAreaId',
-                'multiCountryName',
-                'componentId',
-                'periodStartYear',
-                'periodEndYear',
-                'allocationAmount'
-            ]
-            df_allocations = df_allocations[columns_to_keep]
-            return df_allocations
-        else:
-            st.caption("Global Fund API cannot be loaded")
-            return None
-
-    @st.cache_data(show_spinner=False)
-    def Loading_API_GeographicAreas():
-        service_url_areas = 'https://api-gf-api-gf-02.azurewebsites.net/v3.3/odata/GeographicAreas'
-        response_areas = requests.get(service_url_areas)
-        service_url_levels = 'https://api-gf-api-gf-02.azurewebsites.net/v3.3/odata/GeographicAreaLevels'
-        response_levels = requests.get(service_url_levels)
-
-        if response_areas.ok and response_levels.ok:
-            data_areas = response_areas.json()
-            data_levels = response_levels.json()
-            
-            df_geographicAreas = pd.DataFrame(data_areas["value"])
-            df_geographicLevels = pd.DataFrame(data_levels["value"])
-
-            columns_to_keep = [
-                'geographicAreaId',
-                'geographicAreaCode_ISO3',
-                'geographicAreaLevelId',
-                'geographicAreaName',
-                'geographicAreaParentId'
-            ]
-            df_geographicAreas = df_geographicAreas[columns_to_keep]
-
-            df_geographicAreas = df_geographicAreas.merge(
-                df_geographicAreas[['geographicAreaId', 'geographicAreaName']],
-                left_on='geographicAreaParentId',
-                right_on='geographicAreaId',
-                how='left',
-                suffixes=('', '_parent')
-            )
-
-            df_geographicAreas.rename(columns={'geographicAreaName_parent': 'parentGeographicAreaName'}, inplace=True)
-            df_geographicAreas.drop(columns=['geographicAreaParentId', 'geographicAreaId_parent'], inplace=True)
-
-            df_geographicAreas = df_geographicAreas.merge(
-                df_geographicLevels[['geographicAreaLevelId', 'geographicAreaLevelName']],
-                on='geographicAreaLevelId',
-                how='left'
-            )
-
-            df_geographicAreas.drop(columns=['geographicAreaLevelId'], inplace=True)
+    def Loading_API_All():
+        # The API tables, or None when one of them cannot be loaded
+        return engine.Loading_tables(Data_store(), API_session())
 
-            return df_geographicAreas
-        else:
-            st.caption("Global Fund API cannot be loaded")
-            return None
-
-    @st.cache_data(show_spinner=False)
-    def Loading_API_Components():
-        service_url_components = 'https://api-gf-api-gf-02.azurewebsites.net/v3.3/odata/Components'
-        response_components = requests.get(service_url_components)
-        if response_components.ok:
-            data_components = response_components.json()
-            df_components = pd.DataFrame(data_components["value"])
-            return df_components[['componentId', 'componentName']]
-        else:
-            st.caption("Global Fund API cannot be loaded")
-            return None
-
-    @st.cache_data(show_spinner=False)
-    def Loading_API_MultiCountries():
-        service_url_multicountries = 'https://api-gf-api-gf-02.azurewebsites.net/v3.3/odata/MultiCountries'
-        response_multicountries = requests.get(service_url_multicountries)
-        if response_multicountries.ok:
-            data_multicountries = response_multicountries.json()
-            df_multicountries = pd.DataFrame(data_multicountries["value"])
-            return df_multicountries[['multiCountryName', 'geographicAreaId']]
-        else:
-            st.caption("Global Fund API cannot be loaded")
-            return None
-
-    # Load the data
-    df_allocations = Loading_API_Allocations()
-    df_geographicAreas = Loading_API_GeographicAreas()
-    df_components = Loading_API_Components()
-    df_multicountries = Loading_API_MultiCountries()
-
-    # Merge the datasets
-    if df_allocations is not None and df_geographicAreas is not None and df_components is not None and df_multicountries is not None:
-        
-        df_allocations = df_allocations.merge(df_multicountries.rename(columns={'geographicAreaId': 'multicountryGeographicAreaId'}), on='multiCountryName', how='left')
-
-        # Use the geographicAreaId from the multicountry data if the original geographicAreaId is null
-        df_allocations['geographicAreaId'] = df_allocations['geographicAreaId'].combine_first(df_allocations['multicountryGeographicAreaId'])
-        df_allocations.drop(columns=['multicountryGeographicAreaId'], inplace=True)
-
-        # Merge the updated allocations data with the geographic areas data
-        df_combined = df_allocations.merge(df_geographicAreas, on='geographicAreaId', how='left')
-        
-        # Merge the updated allocations data with the components data
-        df_combined = df_combined.merge(df_components, on='componentId', how='left')
-
-        df_combined.drop(columns=['allocationId', 'componentId', 'multiCountryName'], inplace=True)
-
-        # Create a new column capturing either the geographic area name or "Multicountry"
-        df_combined['Location'] = df_combined['geographicAreaName'].fillna('Multicountry')   
-    else:
+    # Merge and type the API tables once per data snapshot instead of on every rerun;
+    # a recent export from `python -m allocations_engine export` skips the API entirely.
+    # A failed load is not kept in the store: the next visit retries the API
+    model = engine.Loading_model(Data_store(), API_session(), SNAPSHOT_TTL)
+    if model is None:
+        st.caption("Global Fund API cannot be loaded")
         st.caption("No data to display")
+        st.stop()
+    snapshot_key, df_combined = model
 
-    # Convert periodStartYear and periodEndYear to string for better categorical representation
-    df_combined['periodStartYear'] = df_combined['periodStartYear'].astype(str)
-    df_combined['periodEndYear'] = df_combined['periodEndYear'].astype(str)
-
-    # Create a new column 'Allocation period' by concatenating periodStartYear and periodEndYear
-    df_combined['Allocation period'] = df_combined['periodStartYear'] + " - " + df_combined['periodEndYear']
+    # Every metric and chart reads from this cube, built once per snapshot
+    cube = engine.Loading_cube(Data_store(), snapshot_key, df_combined)
 
     # Get unique allocation periods for the radio button
-    allocation_periods = df_combined['Allocation period'].unique()
+    allocation_periods = cube.index.get_level_values('Allocation period').unique()
 
-    # Find the allocation period corresponding to the latest periodStartYear
-    latest_start_year = df_combined['periodStartYear'].max()
-    latest_allocation_period = df_combined[df_combined['periodStartYear'] == latest_start_year]['Allocation period'].iloc[0]
+    # Find the allocation period corresponding to the latest periodStartYear (categories are ordered by start year)
+    latest_allocation_period = df_combined['Allocation period'].cat.categories[-1]
 
     # Create a radio button for selecting the allocation period
     selected_allocation_period = col2.radio(
@@ -341,16 +341,17 @@ if st.session_state.count >= 1:
         horizontal=True
     )
 
-    # Filter the DataFrame based on the selected start year
-    df_filtered = df_combined[df_combined['Allocation period'] == selected_allocation_period]
+    # Look up the selected cycle in the cube
+    cube_period = cube.xs(selected_allocation_period, level='Allocation period')
 
     # Calculate metrics
-    total_allocations = df_filtered['allocationAmount'].sum()
-    average_allocations_per_location = df_filtered.groupby('parentGeographicAreaName')['allocationAmount'].sum().mean()
+    total_allocations = cube_period['sum'].sum()
+    average_allocations_per_location = cube_period.groupby(level='parentGeographicAreaName', observed=True)['sum'].sum().mean()
 
-    # Calculate total and average allocation amount per component
-    total_per_component = df_filtered.groupby('componentName')['allocationAmount'].sum()
-    average_per_component = df_filtered.groupby('componentName')['allocationAmount'].mean().round(2)
+    # Calculate total, count and average allocation amount per component
+    component_totals = cube_period.groupby(level='componentName', observed=True)[['sum', 'count']].sum()
+    total_per_component = component_totals['sum']
+    average_per_component = (component_totals['sum'] / component_totals['count']).round(2)
 
     # Calculate percentage of total for each component based on total allocation
     percentage_per_component = (total_per_component / total_allocations * 100).round(0)
@@ -374,159 +375,149 @@ if st.session_state.count >= 1:
         with col3:
             st.metric(label="Avg Allocations per Location", value=format_number(average_allocations_per_location))
 
-    # TABS ------------------------------------
-    col1, col2, col3 = st.columns([8, 35,8], gap='small')
-    tab1, tab2 = col2.tabs(["Components overview 📈","Allocation clustering 🧮"])
-
-    with tab1:
+    # Identifies this session's clustering job, so a newer request supersedes the one in flight
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    @Instrumented('Building_component_figure')
+    @st.cache_data(show_spinner=False, max_entries=256)
+    def Building_component_figure(snapshot_key, period, component, chart, title_text, top_n, _cube_component):
+        # Serialized figure spec per (snapshot, period, component, chart, top N), so Plotly Express only runs on a cache miss
+        metrics.Marking_miss()
+        return engine.Building_component_figure(_cube_component, component, chart, title_text, top_n)
+
+    @Instrumented('Building_export')
+    @st.cache_data(show_spinner=False, max_entries=32)
+    def Building_export(snapshot_key, table, request, fmt, _df):
+        metrics.Marking_miss()
+        return engine.Exporting_bytes(_df, fmt)
+
+    # Lazy views (default): only the view on screen is computed and sent; GF_LAZY_TABS=0 restores eager tabs
+    LAZY_TABS = os.environ.get('GF_LAZY_TABS', '1') == '1'
+    VIEWS = ["Components overview 📈", "Allocation clustering 🧮"]
+
+    def Building_geography(snapshot_key, df_combined):
+        # Hierarchy index with ancestor paths, and subtotals at every level, once per snapshot
+        def Building():
+            tables = Loading_API_All()
+            if tables is None:
+                return None
+            ancestors, areas = engine.Building_hierarchy(tables[1])
+            return areas, engine.Building_rollup(df_combined, ancestors)
+        return Data_store().get(('Building_geography', snapshot_key), Building)
+
+    def Rendering_regional_drilldown():
+        breakdown = st.radio("Break down by", ["Geographic hierarchy"] + list(engine.PIVOT_GROUPINGS)[1:], horizontal=True, key="breakdown")
+        if breakdown in engine.PIVOT_GROUPINGS:
+            # World Bank groupings are levels of the cube, so their totals are one groupby over the period
+            grouping = engine.PIVOT_GROUPINGS[breakdown]
+            totals = engine.Building_pivot(cube_period, list(total_per_component.index), grouping).set_index(grouping)
+            if totals.empty:
+                st.caption("The World Bank classification cannot be loaded")
+                return
+            totals['Total'] = totals.sum(axis=1)
+            st.dataframe(totals.sort_values('Total', ascending=False).style.format(format_number), use_container_width=True)
+            return
+        geography = Building_geography(snapshot_key, df_combined)
+        if geography is None:
+            st.caption("The geographic hierarchy cannot be loaded")
+            return
+        areas, rollup = geography
+        # Areas with children, labelled with their path from the root
+        parents = areas[areas.index.isin(areas['geographicAreaParentId'].dropna())].sort_values('path')
+        area_id = st.selectbox("Drill down into", [None] + list(parents.index), key="drilldown_area",
+                               format_func=lambda area: "Top level" if area is None else parents.at[area, 'path'])
+        # Subtotals are looked up in the precomputed rollup, not grouped again per level
+        subtotals = engine.Subtotals(rollup, areas, selected_allocation_period, list(engine.Children(areas, area_id).index))
+        if subtotals.empty:
+            st.caption("No allocations below this area in {}".format(selected_allocation_period))
+        else:
+            st.dataframe(subtotals.style.format(format_number), use_container_width=True)
+
+    def Rendering_components_tab():
+        pio = Importing('plotly.io')
+        with st.expander("Regional breakdown"):
+            Rendering_regional_drilldown()
+        # Top locations and an "Others" bar by default; every location on demand
+        show_all_locations = st.toggle("Show every location in the bar charts", key="show_all_locations")
+        top_n = None if show_all_locations else engine.BAR_TOP_N
         component_cols = st.columns(len(total_per_component))
 
         # Define base color
         base_color = "#04AA6D"
 
-        for i, (component, total_allocation) in enumerate(total_per_component.items()):
-            percentage = percentage_per_component[component]
-            display_value = str(f"{format_number(total_allocation)} ({int(percentage)}%)")
-            with component_cols[i]:
-
-                # Merge df_filtered with df_combined to get geographicAreaCode_ISO3
-                df_map_data = df_filtered[df_filtered['componentName'] == component]
-                # Aggregate the total allocations per location
-                total_allocation_per_location = df_map_data.groupby('geographicAreaCode_ISO3')['allocationAmount'].sum().reset_index()
-
-                # Additional EDA metrics for each component
-                component_data = df_filtered[df_filtered['componentName'] == component]
-                num_allocations = component_data.shape[0]
-                avg_allocation = component_data['allocationAmount'].mean()
-                subtitle_text = f"{num_allocations} allocations for {format_number(avg_allocation)} on average"
-
-                # Create a choropleth map
-                fig_map = px.choropleth(
-                    total_allocation_per_location,
-                    locations='geographicAreaCode_ISO3',
-                    color='allocationAmount',
-                    hover_name='geographicAreaCode_ISO3',
-                    color_continuous_scale=px.colors.sequential.Plasma,
-                    title="{} {}".format(component, display_value)  # Correctly formatted title
-                    )
-
-                    # Customize the layout
-                fig_map.update_layout(
-                        title={
-                            'text': "{}: {}<br><sub>{}</sub>".format(component, display_value, subtitle_text),  # Combine title and subtitle
-                            'y': 0.95,
-                            'x': 0.5,
-                            'xanchor': 'center',
-                            'yanchor': 'top',
-                            'font': {
-                                'size': 29
-                            }
-                        },
-                    height=450,
-                    geo=dict(
-                        showframe=False,
-                        showcoastlines=False,
-                        projection_type='equirectangular',
-                        bgcolor='rgba(0,0,0,0)',
-                        showland=True,
-                        landcolor='gray'
-                    ),
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    font=dict(color='white'),
-                    margin=dict(l=0, r=0, t=30, b=0),
-                    coloraxis_showscale=False  # Hide the color scale (legend)
-                )
-
-                # Display the map in Streamlit
-                st.plotly_chart(fig_map, use_container_width=True)
-
-                # Calculate the total allocation per location
-                total_allocation_per_location = df_filtered[df_filtered['componentName'] == component].groupby('Location')['allocationAmount'].sum().reset_index()
-                # Sort the locations based on the total allocation amount
-                sorted_locations = total_allocation_per_location.sort_values(by='allocationAmount', ascending=False)['Location']
-                # Group the data by Location and componentName, then sum the allocationAmount
-                df_location_allocations = df_filtered[df_filtered['componentName'] == component].groupby(['Location', 'componentName'])['allocationAmount'].sum().reset_index()
-                # Ensure the Location column is ordered by the sorted_locations
-                df_location_allocations['Location'] = pd.Categorical(df_location_allocations['Location'], categories=sorted_locations, ordered=True)
-
-                # Create a horizontal bar plot using Plotly
-                fig = px.bar(df_location_allocations, 
-                            x='allocationAmount', 
-                            y='Location', 
-                            color='allocationAmount',  # Color based on allocationAmount to apply a gradient
-                            orientation='h', 
-                            title='{} total allocation per location'.format(component), 
-                            labels={'allocationAmount': 'Total Allocation Amount', 'Location': 'Location', 'componentName': 'Component'}, 
-                            template='plotly_dark',
-                            color_continuous_scale=px.colors.sequential.Plasma)  # Use the Plasma color scale
-
-                # Customize the layout to make the plot clearer and extend the y-axis
-                fig.update_layout(
-                    title={
-                        'text': '{} total allocation per location'.format(component),
-                        'y': 1,  # Adjust the title position lower
-                        'x': 0.5,
-                        'xanchor': 'center',
-                        'yanchor': 'top',
-                        'font': {
-                            'size': 20
-                        }
-                    },
-                    xaxis=dict(
-                        title='Total Allocation Amount',
-                        side='top',
-                        title_standoff=10  # Increase the space between the x-axis title and the axis itself
-                    ),
-                    yaxis_title='',
-                    height=1800,  # Increase the height of the plot
-                    margin=dict(l=200, r=20, t=100, b=20),  # Increase the top margin to provide more space for the title
-                    yaxis={'categoryorder': 'total ascending'},  # Ensure y-axis is ordered by total allocation
-                    showlegend=False,  # Hide the legend
-                    coloraxis_showscale=False,  # Hide the color scale
-                    paper_bgcolor='rgba(0,0,0,0)',  # Set the paper background to transparent
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-
-                # Display the plot in Streamlit
-                st.plotly_chart(fig)        
-
-    with tab2:
+        with metrics.Timing('components loop', period=selected_allocation_period):
+            for i, (component, total_allocation) in enumerate(total_per_component.items()):
+                percentage = percentage_per_component[component]
+                display_value = str(f"{format_number(total_allocation)} ({int(percentage)}%)")
+                with component_cols[i]:
+
+                    # Cells of the cube for this component
+                    cube_component = cube_period.xs(component, level='componentName')
+
+                    # Additional EDA metrics for each component
+                    num_allocations = int(component_totals.at[component, 'count'])
+                    avg_allocation = average_per_component[component]
+                    subtitle_text = f"{num_allocations} allocations for {format_number(avg_allocation)} on average"
+
+                    # Display the map in Streamlit
+                    map_spec = Building_component_figure(snapshot_key, selected_allocation_period, component, 'map',
+                                                         "{}: {}<br><sub>{}</sub>".format(component, display_value, subtitle_text), None, cube_component)
+                    Plotting('map ' + component, pio.from_json(map_spec, skip_invalid=True), use_container_width=True)
+
+                    # Display the plot in Streamlit
+                    bar_spec = Building_component_figure(snapshot_key, selected_allocation_period, component, 'bar',
+                                                         '{} total allocation per location'.format(component), top_n, cube_component)
+                    Plotting('bar ' + component, pio.from_json(bar_spec, skip_invalid=True))
+
+    # The clustering controls rerun as a fragment: moving the slider or editing the multiselect only
+    # re-executes this function, not the CSS, header, data loading and components view
+    @st.experimental_fragment
+    def Rendering_clustering_tab():
+        px = Importing('plotly.express')
+        go = Importing('plotly.graph_objects')
         # Layout columns for the elbow plot and the slider
         col2, col3 = st.columns([5, 25])
 
         # Select components using a multiselect widget with all components selected by default
-        all_components = df_filtered['componentName'].unique()
+        all_components = list(total_per_component.index)
         selected_components = col2.multiselect("Select components", all_components, default=all_components)
 
         if not selected_components:
             col2.warning("Select at least one component")
-            st.stop()
-
-        # Filter the dataset based on the selected components
-        df_filtered_components = df_filtered[df_filtered['componentName'].isin(selected_components)]
-
-        # Pivot the DataFrame so that each componentName has its own column
-        df_pivot = df_filtered_components.pivot_table(index='Location', columns='componentName', values='allocationAmount', aggfunc='sum').reset_index()
-
-
-        # Handle missing values by filling with zero
-        df_pivot = df_pivot.fillna(0)
-
-        # Add an elbow plot to find the optimal number of clusters
-        sse = []
-        for k in range(1, 11):
-            kmeans_elbow = KMeans(n_clusters=k)
-            kmeans_elbow.fit(df_pivot.iloc[:, 1:])
-            sse.append(kmeans_elbow.inertia_)
-
-        # Find the optimal number of clusters using the KneeLocator
-        kl = KneeLocator(range(1, 11), sse, curve="convex", direction="decreasing")
-        optimal_k = kl.elbow
+            return
+
+        # Cluster locations, or the World Bank regions or income groups they belong to
+        group_label = col2.selectbox("Group by", list(engine.PIVOT_GROUPINGS), key="cluster_grouping")
+        grouping = engine.PIVOT_GROUPINGS[group_label]
+
+        # Pivot the cube cells of the selected components so that each componentName has its own column
+        df_pivot = engine.Building_pivot(cube_period, selected_components, grouping).rename(columns={grouping: group_label})
+        if len(df_pivot) < 2:
+            col2.warning("Not enough {} rows to cluster".format(group_label.lower()))
+            return
+        if DIAGNOSTICS:
+            metrics.Recording_memory('df_pivot', df_pivot)
+
+        # The elbow fits run as a background job, memoized per (snapshot, period, components, grouping, k range, seed)
+        job = engine.Submitting_clustering(
+            st.session_state.session_id,
+            (snapshot_key, selected_allocation_period, tuple(sorted(selected_components)), grouping, engine.CLUSTER_K_RANGE, engine.CLUSTER_SEED),
+            df_pivot.iloc[:, 1:].to_numpy(), engine.CLUSTER_K_RANGE, engine.CLUSTER_SEED
+        )
+        if not job.done():
+            # Every progress update is a point where a newer interaction interrupts this run,
+            # instead of waiting for the stale fits; the new request then cancels the job
+            progress = col3.progress(0.0, text="Fitting the clustering models")
+            while not job.done():
+                progress.progress(job.progress, text="Fitting the clustering models ({}/{})".format(job.done_fits, job.total_fits or '…'))
+                time.sleep(0.1)
+            progress.empty()
+        ks, sse, cluster_labels, optimal_k = job.result()
 
         # Create the elbow plot
         elbow_fig = go.Figure()
-        elbow_fig.add_trace(go.Scatter(x=list(range(1, 11)), y=sse, mode='lines+markers'))
+        elbow_fig.add_trace(go.Scatter(x=ks, y=sse, mode='lines+markers'))
         elbow_fig.update_layout(
             xaxis_title="Number of Clusters",
             yaxis_title="Sum of Squared Distances",
@@ -535,9 +526,10 @@ if st.session_state.count >= 1:
         )
 
         # Add a circle around the optimal number of clusters
-        elbow_fig.add_trace(go.Scatter(x=[optimal_k], y=[sse[optimal_k - 1]],
-                                    mode="markers", marker=dict(color="#04AA6D", symbol="circle", size=15),
-                                    showlegend=False))
+        if optimal_k is not None:
+            elbow_fig.add_trace(go.Scatter(x=[optimal_k], y=[sse[ks.index(optimal_k)]],
+                                        mode="markers", marker=dict(color="#04AA6D", symbol="circle", size=15),
+                                        showlegend=False))
 
         with col2:
             elbow_fig.update_layout(
@@ -554,24 +546,36 @@ if st.session_state.count >= 1:
             )
 
             # Display the plot with the updated title
-            st.plotly_chart(elbow_fig, use_container_width=True, config={'staticPlot': True})
+            Plotting('elbow', elbow_fig, use_container_width=True, config={'staticPlot': True})
             st.caption("The elbow method is used to determine the optimal number of clusters by finding the point where the sum of squared distances (inertia) starts to diminish. This point represents the optimal number of clusters.")
-            num_clusters = st.slider('Select number of clusters', value=4, min_value=2, max_value=10, key="num_clusters_slider")
-
-        # Apply K-means clustering
-        kmeans = KMeans(n_clusters=num_clusters)
-        df_pivot['Cluster'] = kmeans.fit_predict(df_pivot.iloc[:, 1:])
-
-        # Convert df_filtered to CSV
-        csv_data = df_pivot.to_csv(index=False).encode('utf-8')
+            # Only the fitted k values can be picked
+            if ks[-1] > 2:
+                num_clusters = st.slider('Select number of clusters', value=min(4, ks[-1]), min_value=2, max_value=ks[-1], key="num_clusters_slider")
+            else:
+                num_clusters = ks[-1]
+                st.caption("{} clusters: there are too few rows to fit more".format(num_clusters))
+
+        # Apply K-means clustering, reusing the elbow fit for that k
+        df_pivot['Cluster'] = cluster_labels[num_clusters]
+
+        # The download payload is only built once asked for, and cached per (period, components, k, format)
+        export_format = col2.radio("Download format", ['csv', 'parquet'], horizontal=True, key="cluster_export_format")
+        export_request = (selected_allocation_period, tuple(sorted(selected_components)), grouping, num_clusters, export_format)
+        if col2.button("Prepare data download"):
+            st.session_state.cluster_export_request = export_request
+        if st.session_state.get('cluster_export_request') == export_request:
+            # Add a download button
+            col2.download_button(
+                label="Download data as {}".format(export_format.upper()),
+                data=Building_export(snapshot_key, 'clusters', export_request, export_format, df_pivot),
+                file_name='filtered_data.{}'.format(export_format),
+                mime=engine.EXPORT_FORMATS[export_format],
+            )
 
-        # Add a download button
-        col2.download_button(
-            label="Download data as CSV",
-            data=csv_data,
-            file_name='filtered_data.csv',
-            mime='text/csv',
-        )
+        # Above the threshold the scatter plots use WebGL and show the labels on hover only,
+        # and the bar plot shows the top locations unless asked for all of them
+        large = len(df_pivot) > engine.WEBGL_THRESHOLD
+        point_text = None if large else group_label
 
         with col3:
             if len(selected_components) == 3:
@@ -582,7 +586,8 @@ if st.session_state.count >= 1:
                                     z=df_pivot.columns[3],  # Third component dimension
                                     color=df_pivot['Cluster'].astype(str),  # Color by cluster
                                     size=df_pivot.iloc[:, 1:].sum(axis=1),  # Size based on total allocation amount
-                                    text='Location',  # Text for hover info
+                                    text=point_text,  # Text labels on the points
+                                    hover_name=group_label,
                                     labels={
                                         df_pivot.columns[1]: df_pivot.columns[1],
                                         df_pivot.columns[2]: df_pivot.columns[2],
@@ -625,7 +630,9 @@ if st.session_state.count >= 1:
                                 y=df_pivot.columns[2],  # Second component dimension
                                 color=df_pivot['Cluster'].astype(str),  # Color by cluster
                                 size=df_pivot.iloc[:, 1:].sum(axis=1),  # Size based on total allocation amount
-                                text='Location',  # Text for hover info
+                                text=point_text,  # Text labels on the points
+                                hover_name=group_label,
+                                render_mode='webgl' if large else 'auto',
                                 labels={
                                     df_pivot.columns[1]: df_pivot.columns[1],
                                     df_pivot.columns[2]: df_pivot.columns[2],
@@ -653,14 +660,18 @@ if st.session_state.count >= 1:
                     plot_bgcolor='rgba(0,0,0,0)' 
                 )
             else:
+                df_bars = df_pivot
+                if large and not st.toggle("Show every {}".format(group_label.lower()), key="cluster_show_all"):
+                    df_bars = df_pivot.nlargest(engine.BAR_TOP_N, selected_components[0])
+                    st.caption("Top {} of {} by allocation amount".format(engine.BAR_TOP_N, len(df_pivot)))
                 # Create a bar plot using Plotly Express
-                fig = px.bar(df_pivot,
-                            x='Location',  # X-axis set to Location
+                fig = px.bar(df_bars,
+                            x=group_label,  # X-axis set to the grouping
                             y=selected_components[0],  # Y-axis set to the selected component
-                            color=df_pivot['Cluster'].astype(str),  # Color by cluster
-                            text='Location',  # Text for hover info
+                            color=df_bars['Cluster'].astype(str),  # Color by cluster
+                            text=point_text,  # Text labels on the bars
                             labels={
-                                'Location': 'Location',
+                                group_label: group_label,
                                 selected_components[0]: 'Allocation Amount',
                                 'Cluster': 'Cluster number'
                             })
@@ -668,7 +679,7 @@ if st.session_state.count >= 1:
                 # Customize the layout for better readability and set the height to 800
                 fig.update_layout(
                     title={
-                        'text': 'Bar Plot of Allocation Amounts by Location',
+                        'text': 'Bar Plot of Allocation Amounts by {}'.format(group_label),
                         'y': 1,  # Adjust the title position lower
                         'x': 0.5,
                         'xanchor': 'center',
@@ -677,7 +688,7 @@ if st.session_state.count >= 1:
                             'size': 20
                         }
                     },
-                    xaxis_title='Location',
+                    xaxis_title=group_label,
                     yaxis_title='Allocation Amount',
                     legend_title_text='Cluster number',  # Update legend title
                     template='plotly_dark',
@@ -687,4 +698,38 @@ if st.session_state.count >= 1:
                 )
                 
                 # Display the plot in Streamlit
-            st.plotly_chart(fig, use_container_width=True)
+            Plotting('clusters', fig, use_container_width=True)
+
+    # TABS ------------------------------------
+    col1, col2, col3 = st.columns([8, 35,8], gap='small')
+    if LAZY_TABS:
+        # st.tabs runs every tab body on each rerun, so the lazy mode switches views with a radio instead
+        active_view = col2.radio("View", VIEWS, horizontal=True, label_visibility="collapsed", key="active_view")
+        with col2:
+            if active_view == VIEWS[0]:
+                Rendering_components_tab()
+            else:
+                Rendering_clustering_tab()
+    else:
+        tab1, tab2 = col2.tabs(VIEWS)
+        with tab1:
+            Rendering_components_tab()
+        with tab2:
+            Rendering_clustering_tab()
+
+    # Whole merged allocations table, all cycles, in compact typed formats
+    with col2.expander("Download the full allocations table"):
+        full_export_format = st.radio("Format", ['parquet', 'arrow', 'csv'], horizontal=True, key="full_export_format",
+                                      help="Parquet and Arrow keep the column types and are much smaller than CSV")
+        if st.button("Prepare full download"):
+            st.session_state.full_export_request = (snapshot_key, full_export_format)
+        if st.session_state.get('full_export_request') == (snapshot_key, full_export_format):
+            st.download_button(
+                label="Download allocations as {}".format(full_export_format.upper()),
+                data=Building_export(snapshot_key, 'allocations', None, full_export_format, df_combined),
+                file_name='allocations.{}'.format(full_export_format),
+                mime=engine.EXPORT_FORMATS[full_export_format],
+            )
+
+Reporting_startup_profile("main page" if st.session_state.count >= 1 else "landing page")
+Reporting_diagnostics()
@@ -0,0 +1,15 @@
+"""Headless data engine behind the Allocations app: API loaders, model, aggregations and clustering."""
+from .api import API_ENTITIES, Creating_session
+from .client import BREAKERS, BREAKERS_LOCK, CircuitOpen, Requesting
+from .loaders import Loading_API_All
+from .model import Building_model, Building_cube, Building_pivot, Building_period_summary, Loading_precomputed, PIVOT_GROUPINGS
+from .geography import Building_hierarchy, Building_rollup, Children, Subtotals
+from .figures import BAR_TOP_N, WEBGL_THRESHOLD, Building_component_figure, Top_n
+from .export import EXPORT_FORMATS, Exporting_bytes
+from .service import QUERY_PORT, Serving
+from .clustering import CLUSTER_K_RANGE, CLUSTER_SEED, Cancelled, Clustering_engine
+from .jobs import Submitting_clustering
+from .profiling import Importing, STARTUP_PROFILE
+from .snapshots import SNAPSHOT_TTL
+from .store import SharedStore, Loading_tables, Loading_model, Loading_cube
+from . import instrumentation as metrics
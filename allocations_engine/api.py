@@ -0,0 +1,91 @@
+"""OData queries against the Global Fund API."""
+import os
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from .client import Requesting
+from .instrumentation import Recording_response
+
+# GF_API_BASE_URL points the loaders at another OData service, e.g. the benchmark stand-in
+API_BASE_URL = os.environ.get('GF_API_BASE_URL', 'https://api-gf-api-gf-02.azurewebsites.net/v3.3/odata/')
+API_ENTITIES = ['Allocations', 'GeographicAreas', 'GeographicAreaLevels', 'Components', 'MultiCountries']
+
+# Fields the app actually uses, requested with $select so the API only sends and we only decode these
+API_SELECT = {
+    'Allocations': [
+        'allocationId',
+        'geographicAreaId',
+        'multiCountryName',
+        'componentId',
+        'periodStartYear',
+        'periodEndYear',
+        'allocationAmount'
+    ],
+    'GeographicAreas': [
+        'geographicAreaId',
+        'geographicAreaCode_ISO3',
+        'geographicAreaLevelId',
+        'geographicAreaName',
+        'geographicAreaParentId'
+    ],
+    'GeographicAreaLevels': ['geographicAreaLevelId', 'geographicAreaLevelName'],
+    'Components': ['componentId', 'componentName'],
+    'MultiCountries': ['multiCountryName', 'geographicAreaId']
+}
+
+# Optional first allocation cycle to load (e.g. GF_MIN_PERIOD_START_YEAR=2017), pushed down as a $filter
+MIN_PERIOD_START_YEAR = os.environ.get('GF_MIN_PERIOD_START_YEAR')
+
+
+def API_query(entity, odata_filter=None):
+    # odata_filter narrows the base query further, e.g. to the cycles an incremental sync asks for
+    query = {'$select': ','.join(API_SELECT[entity])}
+    filters = []
+    if entity == 'Allocations' and MIN_PERIOD_START_YEAR:
+        filters.append('periodStartYear ge {}'.format(int(MIN_PERIOD_START_YEAR)))
+    if odata_filter:
+        filters.append(odata_filter)
+    if filters:
+        query['$filter'] = ' and '.join(filters)
+    return query
+
+
+def Creating_session():
+    # Keep-alive connection pools, meant to be shared by every loader
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=len(API_ENTITIES))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Every response through the shared session is counted in the HTTP metrics
+    session.hooks['response'].append(Recording_response)
+    return session
+
+
+def Fetching_API(session, entity, headers=None, odata_filter=None):
+    # Returns (status, table, validators) with status 'ok', 'not modified' or 'error'
+    # Follow @odata.nextLink so a paged entity set is never silently truncated
+    records = []
+    url, params = API_BASE_URL + entity, API_query(entity, odata_filter)
+    validators = None
+    try:
+        while url:
+            response = Requesting(session, url, params=params, headers=headers)
+            if response.status_code == 304:
+                return 'not modified', None, validators
+            if not response.ok:
+                return 'error', None, None
+            if validators is None:
+                validators = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+            data = response.json()
+            records.extend(data["value"])
+            # nextLink already carries the query options, and conditional headers only apply to the first page
+            url, params, headers = data.get('@odata.nextLink'), None, None
+    except requests.RequestException:
+        # Includes timeouts after the retries and an open circuit breaker: the caller serves its snapshot
+        return 'error', None, None
+    return 'ok', pd.DataFrame(records, columns=API_SELECT[entity]), validators
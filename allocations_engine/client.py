@@ -0,0 +1,100 @@
+"""Bounded-latency GET for every upstream call: timeouts, jittered retries and a circuit breaker per host.
+
+A request waits at most the connect timeout for a connection and the read timeout between bytes, and is
+retried on connection errors, timeouts and 429/5xx answers with full-jitter exponential backoff. After
+BREAKER_THRESHOLD consecutive failures a host's breaker opens: calls fail at once with CircuitOpen (a
+requests exception, so the loaders fall back to their last good snapshot) until BREAKER_COOLDOWN
+seconds have passed, when one trial request is let through.
+"""
+import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+from .instrumentation import Recording_failure
+
+CONNECT_TIMEOUT = float(os.environ.get('GF_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('GF_READ_TIMEOUT', 30))
+RETRIES = int(os.environ.get('GF_HTTP_RETRIES', 2))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+BREAKER_THRESHOLD = int(os.environ.get('GF_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.environ.get('GF_BREAKER_COOLDOWN', 30))
+
+BREAKERS_LOCK = threading.Lock()
+BREAKERS = {}
+
+
+class CircuitOpen(requests.ConnectionError):
+    pass
+
+
+def Breaker_allowing(host):
+    # Closed: every call goes through. Open: none until the cooldown ends, then a single trial (half-open).
+    # A trial that never reported back is given up after another cooldown, and a new trial let through
+    with BREAKERS_LOCK:
+        breaker = BREAKERS.setdefault(host, {'state': 'closed', 'failures': 0, 'opened_at': None, 'trial_at': None})
+        if breaker['state'] == 'closed':
+            return True
+        since = breaker['opened_at'] if breaker['state'] == 'open' else breaker['trial_at']
+        if time.time() - since >= BREAKER_COOLDOWN:
+            breaker.update(state='half-open', trial_at=time.time())
+            return True
+        return False
+
+
+def Breaker_recording(host, ok):
+    with BREAKERS_LOCK:
+        breaker = BREAKERS[host]
+        if ok:
+            breaker.update(state='closed', failures=0, opened_at=None, trial_at=None)
+            return
+        breaker['failures'] += 1
+        if breaker['state'] == 'half-open' or breaker['failures'] >= BREAKER_THRESHOLD:
+            breaker.update(state='open', opened_at=time.time(), trial_at=None)
+
+
+def Backoff(attempt, response=None):
+    # Full jitter, capped; a Retry-After in seconds from the server is honoured within the cap
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(BACKOFF_MAX, float(retry_after)))
+    return delay
+
+
+def Requesting(session, url, params=None, headers=None, timeout=None, retries=None):
+    # Returns the last response (which may be an error status) or raises a requests exception
+    host = urlsplit(url).netloc
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    retries = RETRIES if retries is None else retries
+    if not Breaker_allowing(host):
+        Recording_failure(url, 'circuit open')
+        raise CircuitOpen('Circuit open for {}'.format(host))
+
+    try:
+        for attempt in range(retries + 1):
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=timeout)
+            except requests.RequestException as error:
+                Recording_failure(url, type(error).__name__)
+                if attempt == retries:
+                    raise
+                time.sleep(Backoff(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                Breaker_recording(host, True)
+                return response
+            if attempt == retries:
+                Breaker_recording(host, False)
+                return response
+            time.sleep(Backoff(attempt, response))
+    except BaseException:
+        # Any exception counts as a failure, so a half-open trial always reports back
+        Breaker_recording(host, False)
+        raise
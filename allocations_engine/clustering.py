@@ -0,0 +1,44 @@
+"""Seeded elbow curve and K-means labels for the clustering view."""
+from .profiling import Importing
+
+# Elbow range and seed of the clustering engine; a fixed seed makes the fits deterministic and cacheable
+CLUSTER_K_RANGE = (1, 11)
+CLUSTER_SEED = 42
+
+
+class Cancelled(Exception):
+    pass
+
+
+def Fitting_kmeans(KMeans, features, k, seed, job=None):
+    # A superseded job stops before its next fit
+    if job is not None and job.cancelled.is_set():
+        raise Cancelled()
+    kmeans = KMeans(n_clusters=k, random_state=seed)
+    labels = kmeans.fit_predict(features)
+    if job is not None:
+        job.advance()
+    return kmeans.inertia_, labels
+
+
+def Clustering_engine(features, k_range=CLUSTER_K_RANGE, seed=CLUSTER_SEED, job=None):
+    # Fit every k of the elbow range in parallel; the labels are kept so the final assignment reuses its fit.
+    # job (see jobs.py) receives the progress and can cancel the remaining fits, which then run in sequence.
+    # Returns (ks, sse, labels per k, optimal k or None)
+    KMeans = Importing('sklearn.cluster').KMeans
+    joblib = Importing('joblib')
+    ks = list(range(k_range[0], min(k_range[1], len(features) + 1)))
+    if job is not None:
+        job.total_fits = len(ks)
+    if job is None:
+        fits = joblib.Parallel(n_jobs=-1, prefer='threads')(joblib.delayed(Fitting_kmeans)(KMeans, features, k, seed) for k in ks)
+    else:
+        # A background job fits one k at a time: a superseded job stops at its next fit, and the job pool's
+        # workers don't each start a joblib pool of their own on top of sklearn's threads
+        fits = [Fitting_kmeans(KMeans, features, k, seed, job) for k in ks]
+    sse = [inertia for inertia, _ in fits]
+    labels = {k: k_labels for k, (_, k_labels) in zip(ks, fits)}
+
+    # Find the optimal number of clusters using the KneeLocator
+    kl = Importing('kneed').KneeLocator(ks, sse, curve="convex", direction="decreasing")
+    return ks, sse, labels, kl.elbow
@@ -0,0 +1,98 @@
+"""Batch export of every allocation cycle, e.g. from a nightly job that warms the app's cache."""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+
+from . import snapshots
+from .api import Creating_session
+from .loaders import Loading_API_All
+from .model import Building_model, Building_cube, Building_period_summary, Building_pivot
+from .profiling import Importing
+
+# MIME type of each export format; the format name is also the file extension
+EXPORT_FORMATS = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'csv': 'text/csv',
+}
+
+
+def Exporting_bytes(df, fmt):
+    # Parquet and Arrow IPC keep the column types and are much smaller and faster to read than CSV
+    if fmt == 'csv':
+        return df.to_csv(index=False).encode('utf-8')
+    buffer = io.BytesIO()
+    if fmt == 'parquet':
+        df.to_parquet(buffer, index=False)
+    else:
+        pa = Importing('pyarrow')
+        ipc = Importing('pyarrow.ipc')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with ipc.new_file(buffer, table.schema) as writer:
+            writer.write_table(table)
+    return buffer.getvalue()
+
+
+def Writing_table(df, directory, name, fmt):
+    path = os.path.join(directory, '{}.{}'.format(name, fmt))
+    with open(path, 'wb') as f:
+        f.write(Exporting_bytes(df, fmt))
+    return path
+
+
+def Exporting_all(directory, formats=('parquet',)):
+    # Loads the API tables (through the snapshot store), builds the model and writes the model, the cube,
+    # the per-period summary and one clustering pivot per period. Returns the manifest, or None if loading failed
+    tables = Loading_API_All(Creating_session())
+    if any(table is None for table in tables):
+        return None
+    snapshot_key, df_combined = Building_model(*tables)
+    cube = Building_cube(df_combined)
+    summary = Building_period_summary(cube)
+
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for fmt in formats:
+        files.append(Writing_table(df_combined, directory, 'combined', fmt))
+        files.append(Writing_table(cube.reset_index(), directory, 'cube', fmt))
+        files.append(Writing_table(summary.reset_index(), directory, 'summary', fmt))
+        for period in df_combined['Allocation period'].cat.categories:
+            cube_period = cube.xs(period, level='Allocation period')
+            components = list(cube_period.index.get_level_values('componentName').unique())
+            df_pivot = Building_pivot(cube_period, components)
+            files.append(Writing_table(df_pivot, directory, 'pivot_{}'.format(period.replace(' ', '')), fmt))
+
+    manifest = {
+        'snapshot_key': snapshot_key,
+        'generated_at': time.time(),
+        'periods': list(df_combined['Allocation period'].cat.categories),
+        'files': [os.path.basename(path) for path in files]
+    }
+    # The manifest goes last, so the app never picks up a half-written export
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m allocations_engine', description=__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='precompute every allocation cycle and write the results')
+    export_parser.add_argument('--out', default='exports', help='output directory (default: exports)')
+    export_parser.add_argument('--format', choices=list(EXPORT_FORMATS), action='append',
+                               help='output format, can be repeated (default: parquet)')
+    export_parser.add_argument('--snapshot-dir', help='snapshot store directory (default: GF_SNAPSHOT_DIR or .snapshots)')
+    args = parser.parse_args(argv)
+
+    if args.snapshot_dir:
+        snapshots.SNAPSHOT_DIR = args.snapshot_dir
+    # The app only starts from the Parquet artifacts; CSV is for other consumers
+    manifest = Exporting_all(args.out, args.format or ['parquet'])
+    if manifest is None:
+        print("Global Fund API cannot be loaded", file=sys.stderr)
+        return 1
+    print("Exported {} files for {} allocation cycles to {}".format(len(manifest['files']), len(manifest['periods']), args.out))
+    return 0
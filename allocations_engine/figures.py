@@ -0,0 +1,117 @@
+"""Plotly figure specs of the components view, and the size limits of the location charts."""
+import os
+
+import pandas as pd
+
+from .profiling import Importing
+
+# Bar charts show the top N locations and one "Others" bar for the rest, unless asked for all of them
+BAR_TOP_N = int(os.environ.get('GF_BAR_TOP_N', 25))
+# Scatter plots with more points than this switch to WebGL and drop the per-point text labels
+WEBGL_THRESHOLD = int(os.environ.get('GF_WEBGL_THRESHOLD', 100))
+
+
+def Top_n(df, value_column, label_column, n):
+    # The n largest rows, plus one "Others (k)" row summing the rest; n=None keeps every row
+    df = df.sort_values(value_column, ascending=False)
+    if n is None or len(df) <= n + 1:
+        return df
+    others = pd.DataFrame({label_column: ['Others ({})'.format(len(df) - n)], value_column: [df[value_column].iloc[n:].sum()]})
+    return pd.concat([df.iloc[:n], others], ignore_index=True)
+
+
+def Building_component_figure(cube_component, component, chart, title_text, top_n=BAR_TOP_N):
+    # Serialized spec of the choropleth ('map') or location bar chart ('bar', top_n locations) of one component
+    px = Importing('plotly.express')
+    if chart == 'map':
+        # Aggregate the total allocations per location
+        total_allocation_per_location = cube_component.groupby(level='geographicAreaCode_ISO3')['sum'].sum().rename('allocationAmount').reset_index()
+
+        # Create a choropleth map
+        fig_map = px.choropleth(
+            total_allocation_per_location,
+            locations='geographicAreaCode_ISO3',
+            color='allocationAmount',
+            hover_name='geographicAreaCode_ISO3',
+            color_continuous_scale=px.colors.sequential.Plasma,
+            title=title_text
+        )
+
+        # Customize the layout
+        fig_map.update_layout(
+            title={
+                'text': title_text,  # Combine title and subtitle
+                'y': 0.95,
+                'x': 0.5,
+                'xanchor': 'center',
+                'yanchor': 'top',
+                'font': {
+                    'size': 29
+                }
+            },
+            height=450,
+            geo=dict(
+                showframe=False,
+                showcoastlines=False,
+                projection_type='equirectangular',
+                bgcolor='rgba(0,0,0,0)',
+                showland=True,
+                landcolor='gray'
+            ),
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='white'),
+            margin=dict(l=0, r=0, t=30, b=0),
+            coloraxis_showscale=False  # Hide the color scale (legend)
+        )
+        return fig_map.to_json()
+
+    # Calculate the total allocation per location
+    df_location_allocations = cube_component.groupby(level='Location', observed=True)['sum'].sum().rename('allocationAmount').reset_index()
+    df_location_allocations['Location'] = df_location_allocations['Location'].astype(str)
+    # Payload and render time grow with the bars, so the long tail is folded into one bar
+    df_location_allocations = Top_n(df_location_allocations, 'allocationAmount', 'Location', top_n)
+    df_location_allocations['componentName'] = component
+    # Sort the locations based on the total allocation amount
+    sorted_locations = df_location_allocations.sort_values(by='allocationAmount', ascending=False)['Location']
+    # Ensure the Location column is ordered by the sorted_locations
+    df_location_allocations['Location'] = pd.Categorical(df_location_allocations['Location'], categories=sorted_locations, ordered=True)
+
+    # Create a horizontal bar plot using Plotly
+    fig = px.bar(df_location_allocations, 
+                x='allocationAmount', 
+                y='Location', 
+                color='allocationAmount',  # Color based on allocationAmount to apply a gradient
+                orientation='h', 
+                title=title_text, 
+                labels={'allocationAmount': 'Total Allocation Amount', 'Location': 'Location', 'componentName': 'Component'}, 
+                template='plotly_dark',
+                color_continuous_scale=px.colors.sequential.Plasma)  # Use the Plasma color scale
+
+    # Customize the layout to make the plot clearer and extend the y-axis
+    fig.update_layout(
+        title={
+            'text': title_text,
+            'y': 1,  # Adjust the title position lower
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': {
+                'size': 20
+            }
+        },
+        xaxis=dict(
+            title='Total Allocation Amount',
+            side='top',
+            title_standoff=10  # Increase the space between the x-axis title and the axis itself
+        ),
+        yaxis_title='',
+        height=max(450, 12 * len(df_location_allocations) + 150),  # About 12px per bar; every location was 1800px
+        margin=dict(l=200, r=20, t=100, b=20),  # Increase the top margin to provide more space for the title
+        yaxis={'categoryorder': 'total ascending'},  # Ensure y-axis is ordered by total allocation
+        showlegend=False,  # Hide the legend
+        coloraxis_showscale=False,  # Hide the color scale
+        paper_bgcolor='rgba(0,0,0,0)',  # Set the paper background to transparent
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig.to_json()
@@ -0,0 +1,66 @@
+"""Geographic hierarchy index and regional rollups of the allocations.
+
+The hierarchy comes from geographicAreaParentId: every area is paired with itself and each of its
+ancestors (country, sub-region, region, world), so one merge and one groupby roll the allocations up
+to every level at once.
+"""
+import pandas as pd
+
+# Guard against a cycle in the parent links
+MAX_DEPTH = 10
+
+
+def Building_hierarchy(df_geographicAreas):
+    # Returns (ancestors, areas): one row per (area, ancestor, depth) with depth 0 for the area itself,
+    # and the areas indexed by id with their level, parent and ancestor path ("World / Africa / Kenya")
+    areas = df_geographicAreas[['geographicAreaId', 'geographicAreaName', 'geographicAreaLevelName', 'geographicAreaParentId']]
+    areas = areas.drop_duplicates('geographicAreaId').set_index('geographicAreaId')
+    # Parent ids come back as floats because of the nulls at the roots
+    links = areas['geographicAreaParentId'].dropna().astype(areas.index.dtype)
+
+    level = pd.DataFrame({'geographicAreaId': areas.index, 'ancestorId': areas.index, 'depth': 0})
+    pairs = [level]
+    for depth in range(1, MAX_DEPTH):
+        parents = level['ancestorId'].map(links)
+        level = pd.DataFrame({'geographicAreaId': level['geographicAreaId'], 'ancestorId': parents, 'depth': depth}).dropna()
+        if level.empty:
+            break
+        level['ancestorId'] = level['ancestorId'].astype(areas.index.dtype)
+        pairs.append(level)
+    ancestors = pd.concat(pairs, ignore_index=True)
+    ancestors['ancestorName'] = ancestors['ancestorId'].map(areas['geographicAreaName'])
+    ancestors['ancestorLevelName'] = ancestors['ancestorId'].map(areas['geographicAreaLevelName'])
+
+    # Path from the root down to the area
+    paths = ancestors.sort_values(['geographicAreaId', 'depth'], ascending=[True, False])
+    areas = areas.assign(path=paths.groupby('geographicAreaId')['ancestorName'].agg(lambda names: ' / '.join(names.astype(str))))
+    return ancestors, areas
+
+
+def Building_rollup(df_combined, ancestors):
+    # Allocation subtotals of every area at every level, per (period, component), in a single pass
+    leaves = df_combined.groupby(['Allocation period', 'componentName', 'geographicAreaId'], observed=True)['allocationAmount'].sum().reset_index()
+    rolled = leaves.merge(ancestors[['geographicAreaId', 'ancestorId']], on='geographicAreaId')
+    rollup = rolled.groupby(['Allocation period', 'ancestorId', 'componentName'], observed=True)['allocationAmount'].sum()
+    return rollup.sort_index()
+
+
+def Children(areas, area_id):
+    # Direct children of an area, or the roots when area_id is None
+    if area_id is None:
+        return areas[areas['geographicAreaParentId'].isna()]
+    return areas[areas['geographicAreaParentId'] == area_id]
+
+
+def Subtotals(rollup, areas, period, area_ids):
+    # Lookup of the rolled-up totals of some areas in one period: one row per area, one column per component
+    rollup_period = rollup.xs(period, level='Allocation period')
+    available = set(rollup_period.index.get_level_values('ancestorId'))
+    area_ids = [area_id for area_id in area_ids if area_id in available]
+    if not area_ids:
+        return pd.DataFrame()
+    subtotals = rollup_period.loc[area_ids].unstack('componentName', fill_value=0)
+    subtotals.columns = subtotals.columns.astype(str)
+    subtotals['Total'] = subtotals.sum(axis=1)
+    subtotals.index = subtotals.index.map(areas['geographicAreaName'])
+    return subtotals.sort_values('Total', ascending=False)
@@ -0,0 +1,134 @@
+"""Hot-path instrumentation: stage timings, HTTP transfer, cache hits and DataFrame memory.
+
+Every measurement is kept in process-wide aggregates (for the diagnostics panel) and emitted as a
+JSON line on the 'allocations.metrics' logger (GF_METRICS_LOG=1 prints them to stderr).
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger('allocations.metrics')
+if os.environ.get('GF_METRICS_LOG') == '1' and not logger.handlers:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+METRICS_LOCK = threading.Lock()
+STAGES = {}
+HTTP = {}
+CACHES = {}
+MEMORY = {}
+
+# Per script-run state (Streamlit runs each session's script on its own thread)
+_local = threading.local()
+
+
+def Emitting(kind, name, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(dict(kind=kind, name=name, time=time.time(), **fields), default=str))
+
+
+def Starting_run():
+    _local.events = []
+
+
+def Run_events():
+    return list(getattr(_local, 'events', []))
+
+
+@contextlib.contextmanager
+def Timing(stage, **fields):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        with METRICS_LOCK:
+            stats = STAGES.setdefault(stage, {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['calls'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        events = getattr(_local, 'events', None)
+        if events is not None:
+            events.append(dict(stage=stage, seconds=seconds, **fields))
+        Emitting('stage', stage, seconds=seconds, **fields)
+
+
+# Upper bounds (seconds) of the per-endpoint latency histogram; slower responses count in the last column
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def Endpoint(url):
+    # Last path segment, e.g. the OData entity
+    return url.split('?')[0].rstrip('/').rsplit('/', 1)[-1]
+
+
+def HTTP_stats(endpoint):
+    stats = HTTP.get(endpoint)
+    if stats is None:
+        stats = HTTP[endpoint] = {'requests': 0, 'errors': 0, 'bytes': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+        stats.update(('<= {}s'.format(bound), 0) for bound in LATENCY_BUCKETS)
+        stats['> {}s'.format(LATENCY_BUCKETS[-1])] = 0
+    return stats
+
+
+def Recording_response(response, *args, **kwargs):
+    # requests response hook: bytes, latency and latency histogram per endpoint
+    endpoint = Endpoint(response.url)
+    size = len(response.content)
+    seconds = response.elapsed.total_seconds()
+    bucket = next(('<= {}s'.format(bound) for bound in LATENCY_BUCKETS if seconds <= bound), '> {}s'.format(LATENCY_BUCKETS[-1]))
+    with METRICS_LOCK:
+        stats = HTTP_stats(endpoint)
+        stats['requests'] += 1
+        stats['bytes'] += size
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats[bucket] += 1
+    Emitting('http', endpoint, status=response.status_code, bytes=size, seconds=seconds)
+
+
+def Recording_failure(url, kind):
+    # A request that got no response: timeout, connection error, or refused by an open circuit breaker
+    endpoint = Endpoint(url)
+    with METRICS_LOCK:
+        HTTP_stats(endpoint)['errors'] += 1
+    Emitting('http', endpoint, error=kind)
+
+
+def Expecting_cached(name):
+    # Called before a cached function; its body calls Marking_miss() only when it actually runs
+    if not hasattr(_local, 'cached'):
+        _local.cached = []
+    _local.cached.append([name, False])
+
+
+def Marking_miss():
+    cached = getattr(_local, 'cached', None)
+    if cached:
+        cached[-1][1] = True
+
+
+def Finishing_cached():
+    name, missed = _local.cached.pop()
+    Recording_cache(name, not missed)
+    return missed
+
+
+def Recording_cache(name, hit):
+    with METRICS_LOCK:
+        stats = CACHES.setdefault(name, {'hits': 0, 'misses': 0})
+        stats['hits' if hit else 'misses'] += 1
+    Emitting('cache', name, hit=hit)
+
+
+def Recording_memory(name, df):
+    size = int(df.memory_usage(deep=True).sum())
+    with METRICS_LOCK:
+        MEMORY[name] = size
+    Emitting('memory', name, bytes=size, rows=len(df))
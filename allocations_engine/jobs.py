@@ -0,0 +1,89 @@
+"""Clustering jobs run off the script thread, one in flight per session.
+
+A session submitting a new request supersedes its previous job: a job that has not started yet is
+dropped and a running one stops before its next fit. Results are memoized process-wide per request key,
+so a request seen before (in any session) is answered without a job.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .clustering import Clustering_engine
+from .instrumentation import Recording_cache, Timing
+
+CLUSTER_WORKERS = int(os.environ.get('GF_CLUSTER_WORKERS', 2))
+CLUSTER_MEMO_ENTRIES = 256
+
+JOBS_LOCK = threading.Lock()
+JOBS = {}
+RESULTS = OrderedDict()
+_executor = ThreadPoolExecutor(max_workers=CLUSTER_WORKERS, thread_name_prefix='clustering')
+
+
+class ClusteringJob:
+    def __init__(self, key):
+        self.key = key
+        self.cancelled = threading.Event()
+        self.total_fits = 0
+        self.done_fits = 0
+        self.future = None
+        self._lock = threading.Lock()
+
+    def advance(self):
+        with self._lock:
+            self.done_fits += 1
+
+    @property
+    def progress(self):
+        # Fraction of the elbow fits done, between 0 and 1
+        return self.done_fits / self.total_fits if self.total_fits else 0.0
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        # (ks, sse, labels per k, optimal k or None); raises Cancelled for a superseded job
+        return self.future.result()
+
+
+def Running(job, features, k_range, seed):
+    with Timing('clustering job'):
+        result = Clustering_engine(features, k_range, seed, job=job)
+    with JOBS_LOCK:
+        RESULTS[job.key] = result
+        while len(RESULTS) > CLUSTER_MEMO_ENTRIES:
+            RESULTS.popitem(last=False)
+    return result
+
+
+def Submitting_clustering(session_id, key, features, k_range, seed):
+    # key identifies the request, e.g. (snapshot, period, components, grouping, k range, seed)
+    job = ClusteringJob(key)
+    with JOBS_LOCK:
+        current = JOBS.get(session_id)
+        if current is not None and current.key == key and not current.cancelled.is_set():
+            return current
+        if current is not None:
+            current.cancelled.set()
+            current.future.cancel()
+            del JOBS[session_id]
+        hit = key in RESULTS
+        if hit:
+            RESULTS.move_to_end(key)
+            job.future = Future()
+            job.future.set_result(RESULTS[key])
+        else:
+            job.future = _executor.submit(Running, job, features, k_range, seed)
+            JOBS[session_id] = job
+    Recording_cache('Clustering_engine', hit)
+    if not hit:
+        # Finished jobs are not kept per session; their result is in the memo
+        job.future.add_done_callback(lambda future: Forgetting(session_id, job))
+    return job
+
+
+def Forgetting(session_id, job):
+    with JOBS_LOCK:
+        if JOBS.get(session_id) is job:
+            del JOBS[session_id]
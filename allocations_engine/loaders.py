@@ -0,0 +1,70 @@
+"""Concurrent loading of the API tables the model is built from."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .api import API_ENTITIES
+from .snapshots import Fetching_API_snapshot
+from .sync import INCREMENTAL_SYNC, Syncing_allocations
+from .worldbank import WORLDBANK_COLUMNS, WORLDBANK_ENTITY, Loading_worldbank
+from .singleflight import Coalescing
+from .instrumentation import Timing
+
+
+def Loading_API_GeographicAreas(df_geographicAreas, df_geographicLevels, df_economies=None):
+    if df_geographicAreas is None or df_geographicLevels is None:
+        return None
+
+    df_geographicAreas = df_geographicAreas.merge(
+        df_geographicAreas[['geographicAreaId', 'geographicAreaName']],
+        left_on='geographicAreaParentId',
+        right_on='geographicAreaId',
+        how='left',
+        suffixes=('', '_parent')
+    )
+
+    df_geographicAreas.rename(columns={'geographicAreaName_parent': 'parentGeographicAreaName'}, inplace=True)
+    # The parent id stays on the areas table for the hierarchy index; the model drops it
+    df_geographicAreas.drop(columns=['geographicAreaId_parent'], inplace=True)
+
+    df_geographicAreas = df_geographicAreas.merge(
+        df_geographicLevels[['geographicAreaLevelId', 'geographicAreaLevelName']],
+        on='geographicAreaLevelId',
+        how='left'
+    )
+
+    df_geographicAreas.drop(columns=['geographicAreaLevelId'], inplace=True)
+
+    # World Bank region and income group, one merge on ISO3; left empty when the classification is unavailable
+    if df_economies is None:
+        df_economies = pd.DataFrame(columns=WORLDBANK_COLUMNS, dtype=object)
+    df_geographicAreas = df_geographicAreas.merge(df_economies, on='geographicAreaCode_ISO3', how='left')
+
+    return df_geographicAreas
+
+
+def Loading_API_All(session):
+    # Send the five requests, and the World Bank one, at once so a cold load costs about as much as the slowest endpoint.
+    # Returns (allocations, geographic areas, components, multicountries); a table is None when it could not be loaded
+    def Fetching(entity):
+        if entity == WORLDBANK_ENTITY:
+            return Loading_worldbank(session)
+        if entity == 'Allocations' and INCREMENTAL_SYNC:
+            return Syncing_allocations(session)
+        return Fetching_API_snapshot(session, entity)
+
+    def Loading(entity):
+        # Concurrent sessions loading the same entity share one upstream request
+        with Timing('load ' + entity):
+            return Coalescing(entity, lambda: Fetching(entity))
+
+    entities = API_ENTITIES + [WORLDBANK_ENTITY]
+    with ThreadPoolExecutor(max_workers=len(entities)) as executor:
+        tables = dict(zip(entities, executor.map(Loading, entities)))
+
+    return (
+        tables['Allocations'],
+        Loading_API_GeographicAreas(tables['GeographicAreas'], tables['GeographicAreaLevels'], tables[WORLDBANK_ENTITY]),
+        tables['Components'],
+        tables['MultiCountries']
+    )
@@ -0,0 +1,99 @@
+"""Merged, typed allocations model and the aggregations read by the app."""
+import os
+import json
+import time
+
+import pandas as pd
+
+# Low-cardinality text columns are stored as categoricals to keep the model small
+CATEGORICAL_COLUMNS = ['componentName', 'Location', 'geographicAreaLevelName', 'parentGeographicAreaName', 'wbRegion', 'wbIncomeGroup', 'Allocation period']
+
+# Sum, count and mean of the allocations per cell; the parent area and the World Bank classification
+# follow from the location and are kept as keys for the regional metric and the groupings
+CUBE_KEYS = ['Allocation period', 'componentName', 'Location', 'geographicAreaCode_ISO3', 'parentGeographicAreaName', 'wbRegion', 'wbIncomeGroup']
+
+# Rows the clustering pivot can be grouped by, as label -> cube key
+PIVOT_GROUPINGS = {'Location': 'Location', 'World Bank region': 'wbRegion', 'Income group': 'wbIncomeGroup'}
+
+# Artifacts written by `python -m allocations_engine export`, which the app starts from when they are recent
+PRECOMPUTED_DIR = os.environ.get('GF_PRECOMPUTED_DIR')
+
+
+def Building_model(df_allocations, df_geographicAreas, df_components, df_multicountries):
+    # Returns (snapshot_key, df_combined)
+    df_allocations = df_allocations.merge(df_multicountries.rename(columns={'geographicAreaId': 'multicountryGeographicAreaId'}), on='multiCountryName', how='left')
+
+    # Use the geographicAreaId from the multicountry data if the original geographicAreaId is null
+    df_allocations['geographicAreaId'] = df_allocations['geographicAreaId'].combine_first(df_allocations['multicountryGeographicAreaId'])
+    df_allocations.drop(columns=['multicountryGeographicAreaId'], inplace=True)
+
+    # Merge the updated allocations data with the geographic areas data
+    df_combined = df_allocations.merge(df_geographicAreas, on='geographicAreaId', how='left')
+
+    # Merge the updated allocations data with the components data
+    df_combined = df_combined.merge(df_components, on='componentId', how='left')
+
+    df_combined.drop(columns=['allocationId', 'componentId', 'multiCountryName', 'geographicAreaParentId'], inplace=True)
+
+    # Create a new column capturing either the geographic area name or "Multicountry"
+    df_combined['Location'] = df_combined['geographicAreaName'].fillna('Multicountry')
+
+    # Keep the years as integers; the period label is only built once per distinct (start, end) pair
+    df_combined['periodStartYear'] = df_combined['periodStartYear'].astype('int16')
+    df_combined['periodEndYear'] = df_combined['periodEndYear'].astype('int16')
+    periods = df_combined[['periodStartYear', 'periodEndYear']].drop_duplicates().sort_values(['periodStartYear', 'periodEndYear'])
+    periods['Allocation period'] = periods['periodStartYear'].astype(str) + " - " + periods['periodEndYear'].astype(str)
+    df_combined = df_combined.merge(periods, on=['periodStartYear', 'periodEndYear'], how='left')
+
+    for column in CATEGORICAL_COLUMNS:
+        df_combined[column] = df_combined[column].astype('category')
+    df_combined['Allocation period'] = df_combined['Allocation period'].cat.set_categories(periods['Allocation period'].unique(), ordered=True)
+
+    # Content hash identifying this snapshot of the model, used to key the downstream caches
+    snapshot_key = format(int(pd.util.hash_pandas_object(df_combined, index=False).sum()), 'x')
+    return snapshot_key, df_combined
+
+
+def Building_cube(df_combined):
+    # One vectorized pass over the allocation table; every metric and chart reads from this
+    cube = df_combined.groupby(CUBE_KEYS, observed=True, dropna=False)['allocationAmount'].agg(['sum', 'count', 'mean'])
+    return cube.sort_index()
+
+
+def Building_period_summary(cube):
+    # Total, count and average allocation per (period, component)
+    summary = cube.groupby(level=['Allocation period', 'componentName'], observed=True)[['sum', 'count']].sum()
+    summary['mean'] = summary['sum'] / summary['count']
+    return summary
+
+
+def Building_pivot(cube_period, components, by='Location'):
+    # One row per location (or per World Bank region or income group) and one column per selected component,
+    # as used by the clustering; locations without a classification are left out of the grouped pivots
+    cube_components = cube_period[cube_period.index.get_level_values('componentName').isin(components)]
+    # Missing (location, component) cells are filled with zero on the values only: the grouping is categorical,
+    # and a frame-wide fillna(0) would try to add 0 as a category
+    df_pivot = cube_components.groupby(level=[by, 'componentName'], observed=True)['sum'].sum().unstack('componentName', fill_value=0)
+    # Plain column labels, so the 'Location' and 'Cluster' columns can be inserted next to the components
+    df_pivot.columns = df_pivot.columns.astype(str)
+    return df_pivot.reset_index()
+
+
+def Loading_precomputed(max_age, directory=None):
+    # (snapshot_key, df_combined) from the exported artifacts, or None when missing or older than max_age seconds
+    directory = directory or PRECOMPUTED_DIR
+    if not directory:
+        return None
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if time.time() - manifest['generated_at'] > max_age:
+            return None
+        # Parquet keeps the categorical and int16 dtypes of the model
+        df_combined = pd.read_parquet(os.path.join(directory, 'combined.parquet'))
+        # An export from before a cube key was added is rebuilt from the API instead
+        if not set(CUBE_KEYS).issubset(df_combined.columns):
+            return None
+        return manifest['snapshot_key'], df_combined
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,17 @@
+"""Deferred imports of heavy dependencies, with their cold import times."""
+import sys
+import time
+import importlib
+
+# Process-wide, so each entry is the cold (first) time only
+STARTUP_PROFILE = {'imports': {}, 'renders': {}}
+
+
+def Importing(module_name):
+    # Import a heavy dependency the first time a code path needs it, and record how long it took
+    module = sys.modules.get(module_name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        STARTUP_PROFILE['imports'][module_name] = time.perf_counter() - start
+    return module
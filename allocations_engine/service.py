@@ -0,0 +1,119 @@
+"""Local query service over the shared model store, for dashboards that need the app's totals.
+
+    GET /periods
+    GET /model?period=2023 - 2025&component=HIV&location=KEN&format=arrow
+    GET /cube?...          sum, count and mean per (period, component, location) cell
+    GET /totals?by=period,component&...
+
+period, component and location can be repeated or comma-separated; a location matches its name or
+its ISO3 code. format is json (records, the default), arrow (Arrow IPC file, which readers map
+without copying) or csv. Every answer reads the process-wide SharedStore, so a request after the app
+has loaded adds no upstream traffic.
+"""
+import os
+import json
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from .export import EXPORT_FORMATS, Exporting_bytes
+from .instrumentation import Timing
+from .store import Loading_model, Loading_cube
+
+# The service only starts when GF_QUERY_PORT is set; it listens on the loopback interface by default
+QUERY_PORT = os.environ.get('GF_QUERY_PORT')
+QUERY_HOST = os.environ.get('GF_QUERY_HOST', '127.0.0.1')
+
+logger = logging.getLogger('allocations.service')
+
+# Query parameters and /totals dimensions -> model columns
+QUERY_COLUMNS = {
+    'period': 'Allocation period',
+    'component': 'componentName',
+    'location': 'Location',
+    'region': 'wbRegion',
+    'income': 'wbIncomeGroup',
+}
+
+
+def Query_values(query, name):
+    return [value.strip() for values in query.get(name, []) for value in values.split(',') if value.strip()]
+
+
+def Filtering(df, query):
+    # Rows matching every filter given; df has the model columns (not an index)
+    mask = None
+    for name, column in QUERY_COLUMNS.items():
+        values = Query_values(query, name)
+        if not values:
+            continue
+        matches = df[column].isin(values)
+        if name == 'location':
+            matches |= df['geographicAreaCode_ISO3'].isin(values)
+        mask = matches if mask is None else mask & matches
+    return df if mask is None else df[mask]
+
+
+def Querying(store, session, max_age, path, query):
+    # Returns (status, content type, body)
+    # 503 while the store cannot build the model, whether the loaders failed or the build raised
+    try:
+        model = Loading_model(store, session, max_age)
+    except Exception:
+        logger.exception("query service: model build failed")
+        model = None
+    if model is None:
+        return 503, 'application/json', b'{"error": "Global Fund API cannot be loaded"}'
+    snapshot_key, df_combined = model
+
+    if path == 'periods':
+        return 200, 'application/json', json.dumps(list(df_combined['Allocation period'].cat.categories)).encode()
+    if path == 'model':
+        df = Filtering(df_combined, query)
+    elif path in ('cube', 'totals'):
+        df = Filtering(Loading_cube(store, snapshot_key, df_combined).reset_index(), query)
+        if path == 'totals':
+            by = Query_values(query, 'by') or ['period', 'component']
+            if not set(by).issubset(QUERY_COLUMNS):
+                return 400, 'application/json', json.dumps({'error': 'by must be among ' + ', '.join(QUERY_COLUMNS)}).encode()
+            df = df.groupby([QUERY_COLUMNS[name] for name in by], observed=True)[['sum', 'count']].sum().reset_index()
+            df['mean'] = df['sum'] / df['count']
+    else:
+        return 404, 'application/json', b'{"error": "unknown path"}'
+
+    fmt = (query.get('format') or ['json'])[0]
+    if fmt == 'json':
+        return 200, 'application/json', df.to_json(orient='records').encode()
+    if fmt in ('arrow', 'csv'):
+        return 200, EXPORT_FORMATS[fmt], Exporting_bytes(df, fmt)
+    return 400, 'application/json', b'{"error": "format must be json, arrow or csv"}'
+
+
+def Serving(store, session, max_age, host=QUERY_HOST, port=None):
+    # Starts the service on a daemon thread and returns the server (server.shutdown() stops it)
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = url.path.strip('/')
+            with Timing('query ' + path):
+                try:
+                    status, content_type, body = Querying(store, session, max_age, path, parse_qs(url.query))
+                except Exception as error:
+                    # An HTTP answer rather than a dropped connection, e.g. for a table Arrow cannot serialize
+                    logger.exception("query service: %s failed", self.path)
+                    status, content_type = 500, 'application/json'
+                    body = json.dumps({'error': '{}: {}'.format(type(error).__name__, error)}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, int(port or QUERY_PORT)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='query-service', daemon=True).start()
+    return server
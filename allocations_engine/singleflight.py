@@ -0,0 +1,55 @@
+"""Single-flight coalescing of identical in-flight loads, with short negative caching.
+
+On a cold start several sessions can ask for the same endpoint at the same moment. The first caller
+(the leader) runs the fetch; the others wait for it and receive the same result, or the same exception,
+instead of sending their own upstream request and decoding their own copy. The app's SharedStore already
+builds the whole model once per key; this layer works per entity and also covers the export CLI and any
+process without a store.
+
+A failed fetch (an exception, or None, which the loaders return when there is neither an answer nor a
+snapshot) is kept for GF_FAILURE_TTL seconds, so while upstream is down on a cold start each new visitor
+gets the failure at once instead of starting another upstream fetch.
+"""
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+from .instrumentation import Recording_cache
+
+FAILURE_TTL = float(os.environ.get('GF_FAILURE_TTL', 30))
+
+FLIGHTS_LOCK = threading.Lock()
+FLIGHTS = {}
+FAILURES = {}
+
+
+def Coalescing(key, fetch):
+    # Runs fetch() once per key at a time and hands its result to every concurrent caller
+    with FLIGHTS_LOCK:
+        failure = FAILURES.get(key)
+        if failure is not None and time.time() - failure[0] >= FAILURE_TTL:
+            del FAILURES[key]
+            failure = None
+        flight = failure[1] if failure is not None else FLIGHTS.get(key)
+        leader = flight is None
+        if leader:
+            flight = FLIGHTS[key] = Future()
+    # Counted as a hit when the call joined a fetch in flight or got a recent failure
+    Recording_cache('single-flight ' + key, not leader)
+    if not leader:
+        return flight.result()
+
+    try:
+        result = fetch()
+    except BaseException as error:
+        flight.set_exception(error)
+        raise
+    else:
+        flight.set_result(result)
+        return result
+    finally:
+        with FLIGHTS_LOCK:
+            del FLIGHTS[key]
+            if flight.exception() is not None or flight.result() is None:
+                FAILURES[key] = (time.time(), flight)
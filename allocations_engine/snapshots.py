@@ -0,0 +1,84 @@
+"""Disk snapshots of the API tables, so redeploys, restarts and keep-alive wake-ups start from local files."""
+import os
+import json
+import time
+
+import pandas as pd
+
+from .api import API_query, Fetching_API
+
+SNAPSHOT_DIR = os.environ.get('GF_SNAPSHOT_DIR', '.snapshots')
+SNAPSHOT_TTL = int(os.environ.get('GF_SNAPSHOT_TTL', 24 * 60 * 60))
+
+
+def Snapshot_paths(entity):
+    base = os.path.join(SNAPSHOT_DIR, entity)
+    return base + '.parquet', base + '.json'
+
+
+def Reading_snapshot_meta(entity):
+    data_path, meta_path = Snapshot_paths(entity)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A snapshot taken with another $select/$filter does not answer the current query
+    if meta.get('query') != API_query(entity):
+        return None
+    return meta
+
+
+def Writing_snapshot_meta(entity, meta):
+    _, meta_path = Snapshot_paths(entity)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def Writing_snapshot(entity, df, validators, fetched_at=None):
+    # fetched_at is the time of the last full download; validated_at the last time the data was known current
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    data_path, _ = Snapshot_paths(entity)
+    # Write then rename so a concurrent reader never sees a half-written file
+    df.to_parquet(data_path + '.tmp', index=False)
+    os.replace(data_path + '.tmp', data_path)
+    now = time.time()
+    Writing_snapshot_meta(entity, dict(validators, query=API_query(entity), fetched_at=fetched_at or now, validated_at=now))
+
+
+def Fetching_API_snapshot(session, entity):
+    data_path, _ = Snapshot_paths(entity)
+    meta = Reading_snapshot_meta(entity)
+
+    # Fresh snapshot: no network call at all
+    if meta is not None and time.time() - meta['validated_at'] < SNAPSHOT_TTL:
+        return pd.read_parquet(data_path)
+
+    # Stale snapshot: revalidate with ETag / Last-Modified where the API sends them
+    headers = {}
+    if meta is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    status, df, validators = Fetching_API(session, entity, headers)
+    if status == 'ok':
+        try:
+            Writing_snapshot(entity, df, validators)
+        except OSError:
+            pass
+        return df
+    if meta is None:
+        return None
+    if status == 'not modified':
+        meta['validated_at'] = time.time()
+        try:
+            Writing_snapshot_meta(entity, meta)
+        except OSError:
+            pass
+    # Unchanged upstream, or API down: serve the snapshot we have
+    return pd.read_parquet(data_path)
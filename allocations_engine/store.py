@@ -0,0 +1,112 @@
+"""Process-wide store of the model tables, shared by every session without copies.
+
+st.cache_data pickles a cached DataFrame and hands each caller its own copy, so memory grew with the
+number of sessions. The store keeps one instance of each table and returns that same object, which
+callers must treat as read-only. With pandas copy-on-write on (the app turns it on), whatever a session
+derives from a shared table (xs, filters, column selections) shares its buffers until written to, pandas
+assignments copy first, and .values/.to_numpy() give read-only arrays. Nothing stops an in-place change
+through the internals or to the objects held in an object column.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from .loaders import Loading_API_All
+from .model import Building_model, Building_cube, Loading_precomputed
+from .instrumentation import Recording_cache, Recording_memory, Timing
+
+
+class SharedStore:
+    # Entries are evicted least recently used beyond max_entries, and after ttl seconds when set.
+    # A build runs once per key: concurrent sessions asking for the same key wait for it
+
+    def __init__(self, max_entries=16, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def lookup(self, key):
+        # (True, value), or (False, None) when missing or expired
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            stored_at, value = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def get(self, key, build, name=None):
+        # name labels the timings and hit counts, by default the first item of a tuple key
+        name = name or (key[0] if isinstance(key, tuple) else key)
+        found, value = self.lookup(key)
+        if not found:
+            with self._lock:
+                building = self._building.setdefault(key, threading.Lock())
+            with building:
+                found, value = self.lookup(key)
+                if not found:
+                    with Timing(name):
+                        value = build()
+                    # A failed build (None) is not kept, so the next session retries
+                    if value is not None:
+                        self.put(key, value)
+            with self._lock:
+                self._building.pop(key, None)
+        Recording_cache(name, found)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, key=None):
+        # One key, or everything
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+
+# Store keys of the model tables, shared by the app and the query service
+def Loading_tables(store, session):
+    # The API tables, or None when one of them cannot be loaded
+    def Loading():
+        tables = Loading_API_All(session)
+        return None if any(table is None for table in tables) else tables
+    return store.get('Loading_API_All', Loading)
+
+
+def Loading_model(store, session, max_age):
+    # (snapshot_key, df_combined), or None; a recent export younger than max_age skips the API entirely
+    def Building():
+        precomputed = Loading_precomputed(max_age)
+        if precomputed is not None:
+            return precomputed
+        tables = Loading_tables(store, session)
+        if tables is None:
+            return None
+        snapshot_key, df_combined = Building_model(*tables)
+        Recording_memory('df_combined', df_combined)
+        return snapshot_key, df_combined
+    return store.get('Building_model', Building)
+
+
+def Loading_cube(store, snapshot_key, df_combined):
+    def Building():
+        cube = Building_cube(df_combined)
+        Recording_memory('cube', cube)
+        return cube
+    return store.get(('Building_cube', snapshot_key), Building)
@@ -0,0 +1,64 @@
+"""Incremental refresh of the allocations history.
+
+Allocation cycles are append-only, so once the history is on disk a refresh only asks the API for the
+newest cached cycle (which may still be filling up) and anything after it. A full download still runs
+every GF_FULL_SYNC_TTL seconds (default one week) to pick up any correction to older cycles.
+"""
+import os
+import time
+
+import pandas as pd
+
+from .api import Fetching_API
+from .snapshots import SNAPSHOT_TTL, Snapshot_paths, Reading_snapshot_meta, Writing_snapshot, Writing_snapshot_meta, Fetching_API_snapshot
+
+INCREMENTAL_SYNC = os.environ.get('GF_INCREMENTAL_SYNC', '1') == '1'
+FULL_SYNC_TTL = int(os.environ.get('GF_FULL_SYNC_TTL', 7 * 24 * 60 * 60))
+
+
+def Syncing_allocations(session):
+    entity = 'Allocations'
+    data_path, _ = Snapshot_paths(entity)
+    meta = Reading_snapshot_meta(entity)
+
+    # No history yet, or time for the periodic full download: the regular snapshot path
+    if meta is None or time.time() - meta['fetched_at'] > FULL_SYNC_TTL:
+        return Fetching_API_snapshot(session, entity)
+
+    history = pd.read_parquet(data_path)
+    if time.time() - meta['validated_at'] < SNAPSHOT_TTL:
+        return history
+    if history.empty:
+        return Fetching_API_snapshot(session, entity)
+
+    newest_start_year = int(history['periodStartYear'].max())
+    status, delta, _ = Fetching_API(session, entity, odata_filter='periodStartYear ge {}'.format(newest_start_year))
+    if status != 'ok':
+        # API down: serve the history we have
+        return history
+
+    df_allocations = Merging_delta(history, delta, newest_start_year)
+    try:
+        if df_allocations is history:
+            # Nothing new: the history is still current, only its validation time moves
+            meta['validated_at'] = time.time()
+            Writing_snapshot_meta(entity, meta)
+        else:
+            # Validators of the full query don't describe the synced table any more, so they are dropped
+            Writing_snapshot(entity, df_allocations, {'etag': None, 'last_modified': None}, fetched_at=meta['fetched_at'])
+    except OSError:
+        pass
+    return df_allocations
+
+
+def Merging_delta(history, delta, newest_start_year):
+    # The delta holds the newest cached cycle and anything after it. The cached rows of the newest cycle
+    # are only replaced when the delta has rows for that cycle, so an empty or truncated answer never
+    # drops a cycle from the history; later cycles are appended. Returns history itself when unchanged
+    refreshed = delta['periodStartYear'] == newest_start_year
+    later = delta[delta['periodStartYear'] > newest_start_year]
+    if refreshed.any():
+        return pd.concat([history[history['periodStartYear'] < newest_start_year], delta[refreshed], later], ignore_index=True)
+    if later.empty:
+        return history
+    return pd.concat([history, later], ignore_index=True)
@@ -0,0 +1,69 @@
+"""World Bank region and income-group classification of the economies, joined to the areas on ISO3."""
+import os
+import json
+import time
+
+import pandas as pd
+import requests
+
+from .client import Requesting
+from .snapshots import Snapshot_paths, Writing_snapshot_meta
+
+# The whole economy table comes from one bulk request (about 300 rows with the aggregates);
+# an empty GF_WORLDBANK_URL turns the enrichment off, e.g. for offline benchmarks
+WORLDBANK_URL = os.environ.get('GF_WORLDBANK_URL', 'https://api.worldbank.org/v2/country')
+WORLDBANK_ENTITY = 'WorldBankEconomies'
+WORLDBANK_COLUMNS = ['geographicAreaCode_ISO3', 'wbRegion', 'wbIncomeGroup']
+# The classification is revised once a year (on July 1), so the snapshot is only refreshed monthly
+WORLDBANK_TTL = int(os.environ.get('GF_WORLDBANK_TTL', 30 * 24 * 60 * 60))
+
+
+def Fetching_worldbank(session):
+    # Returns the economy table, or None when the API cannot be reached
+    records, page, pages = [], 1, 1
+    try:
+        while page <= pages:
+            response = Requesting(session, WORLDBANK_URL, params={'format': 'json', 'per_page': 500, 'page': page})
+            if not response.ok:
+                return None
+            header, rows = response.json()
+            pages = int(header.get('pages', 1))
+            # Aggregates (regions, income groups, "World") have no region of their own
+            records.extend(
+                (row['id'], row['region']['value'], row['incomeLevel']['value'])
+                for row in rows or [] if row['region']['id'] != 'NA'
+            )
+            page += 1
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        return None
+    return pd.DataFrame.from_records(records, columns=WORLDBANK_COLUMNS)
+
+
+def Loading_worldbank(session):
+    # Served from the local snapshot while it is recent, and from a stale one when the API is down
+    if not WORLDBANK_URL:
+        return None
+    data_path, meta_path = Snapshot_paths(WORLDBANK_ENTITY)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        fresh = meta.get('query') == WORLDBANK_URL and time.time() - meta['validated_at'] < WORLDBANK_TTL
+    except (OSError, ValueError, KeyError):
+        fresh = False
+    if fresh and os.path.exists(data_path):
+        return pd.read_parquet(data_path)
+
+    df_economies = Fetching_worldbank(session)
+    if df_economies is not None:
+        try:
+            os.makedirs(os.path.dirname(data_path) or '.', exist_ok=True)
+            df_economies.to_parquet(data_path + '.tmp', index=False)
+            os.replace(data_path + '.tmp', data_path)
+            now = time.time()
+            Writing_snapshot_meta(WORLDBANK_ENTITY, {'query': WORLDBANK_URL, 'fetched_at': now, 'validated_at': now})
+        except OSError:
+            pass
+        return df_economies
+    if os.path.exists(data_path):
+        return pd.read_parquet(data_path)
+    return None
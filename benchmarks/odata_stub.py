@@ -0,0 +1,105 @@
+"""Local stand-in for the Global Fund OData API, serving recorded or synthetic entity sets."""
+import json
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+FILTER_OPERATORS = {
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'gt': lambda a, b: a is not None and a > b,
+    'ge': lambda a, b: a is not None and a >= b,
+    'lt': lambda a, b: a is not None and a < b,
+    'le': lambda a, b: a is not None and a <= b,
+}
+
+
+def Parsing_filter(expression):
+    # Supports the subset the loaders send: "field op number" clauses joined with "and"
+    clauses = []
+    for clause in expression.split(' and '):
+        field, operator, value = clause.strip().split(' ', 2)
+        value = value.strip("'") if value.startswith("'") else float(value)
+        clauses.append((field, FILTER_OPERATORS[operator], value))
+    return lambda record: all(test(record.get(field), value) for field, test, value in clauses)
+
+
+class ODataStub:
+    # Threaded HTTP server answering /<Entity>?$select=&$filter=&$top=&$skip= like the real service,
+    # with optional server-side paging through @odata.nextLink and ETag revalidation
+
+    def __init__(self, datasets, page_size=None, host='127.0.0.1', port=0):
+        self.datasets = datasets
+        self.page_size = page_size
+        self.etags = {
+            entity: '"{}"'.format(hashlib.sha1(json.dumps(records, sort_keys=True).encode()).hexdigest())
+            for entity, records in datasets.items()
+        }
+        self.server = ThreadingHTTPServer((host, port), self.Handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def Handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                entity = url.path.strip('/').split('/')[-1]
+                if entity not in stub.datasets:
+                    self.send_error(404)
+                    return
+                if self.headers.get('If-None-Match') == stub.etags[entity]:
+                    self.send_response(304)
+                    self.send_header('ETag', stub.etags[entity])
+                    self.end_headers()
+                    return
+
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                records = stub.datasets[entity]
+                if '$filter' in query:
+                    keep = Parsing_filter(query['$filter'])
+                    records = [record for record in records if keep(record)]
+                skip = int(query.get('$skip', 0))
+                top = int(query['$top']) if '$top' in query else None
+                records = records[skip:]
+                if top is not None:
+                    records = records[:top]
+
+                body = {'value': records}
+                if stub.page_size and len(records) > stub.page_size:
+                    body['value'] = records[:stub.page_size]
+                    next_query = dict(query, **{'$skip': skip + stub.page_size})
+                    if top is not None:
+                        next_query['$top'] = top - stub.page_size
+                    body['@odata.nextLink'] = stub.base_url + entity + '?' + urlencode(next_query)
+                if '$select' in query:
+                    fields = query['$select'].split(',')
+                    body['value'] = [{field: record.get(field) for field in fields} for record in body['value']]
+
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.send_header('ETag', stub.etags[entity])
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
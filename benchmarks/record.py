@@ -0,0 +1,45 @@
+"""Record the live API entity sets the loaders use, for replay by the benchmark stand-in."""
+import os
+import sys
+import json
+import argparse
+
+from allocations_engine import api
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), 'recordings')
+
+
+def Recording(directory=DEFAULT_DIR):
+    session = api.Creating_session()
+    os.makedirs(directory, exist_ok=True)
+    for entity in api.API_ENTITIES:
+        # Unprojected records, so the stand-in can answer any $select
+        records, url = [], api.API_BASE_URL + entity
+        while url:
+            response = session.get(url, timeout=(3.05, 60))
+            response.raise_for_status()
+            data = response.json()
+            records.extend(data['value'])
+            url = data.get('@odata.nextLink')
+        with open(os.path.join(directory, entity + '.json'), 'w') as f:
+            json.dump(records, f)
+        print('{}: {} records'.format(entity, len(records)))
+
+
+def Loading_recordings(directory=DEFAULT_DIR):
+    # {entity: records}, or None when any entity set is missing
+    datasets = {}
+    for entity in api.API_ENTITIES:
+        path = os.path.join(directory, entity + '.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            datasets[entity] = json.load(f)
+    return datasets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--out', default=DEFAULT_DIR, help='recordings directory (default: benchmarks/recordings)')
+    Recording(parser.parse_args().out)
+    sys.exit(0)
@@ -0,0 +1,133 @@
+"""Offline benchmark of the data path, against the local OData stand-in.
+
+Each stage is timed and its peak Python/NumPy allocation measured with tracemalloc, which adds some
+overhead to the timings; compare runs with each other rather than with production latencies.
+
+    python -m benchmarks.run --scale 1 10 100 [--recordings DIR] [--page-size N] [--json results.json]
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+import allocations_engine as engine
+from allocations_engine import api, snapshots, worldbank
+from allocations_engine.loaders import Loading_API_GeographicAreas
+
+from .odata_stub import ODataStub
+from .synthetic import Generating_base, Scaling
+from .record import DEFAULT_DIR, Loading_recordings
+
+
+def Measuring(results, scale, stage, fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = fn(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append({'scale': scale, 'stage': stage, 'seconds': round(seconds, 4), 'peak_mb': round(peak / 2 ** 20, 2)})
+    return value
+
+
+def Fetching_raw(session):
+    # Download stage only: the response bodies, not decoded
+    return {entity: session.get(api.API_BASE_URL + entity, params=api.API_query(entity)).content for entity in api.API_ENTITIES}
+
+
+def Decoding(payloads):
+    return {entity: pd.DataFrame(json.loads(payload)['value'], columns=api.API_SELECT[entity]) for entity, payload in payloads.items()}
+
+
+def Merging(tables):
+    df_geographicAreas = Loading_API_GeographicAreas(tables['GeographicAreas'], tables['GeographicAreaLevels'])
+    return engine.Building_model(tables['Allocations'], df_geographicAreas, tables['Components'], tables['MultiCountries'])
+
+
+def Aggregating(df_combined):
+    cube = engine.Building_cube(df_combined)
+    return cube, engine.Building_period_summary(cube)
+
+
+def Pivoting(cube):
+    pivots = {}
+    for period in cube.index.get_level_values('Allocation period').unique():
+        cube_period = cube.xs(period, level='Allocation period')
+        components = list(cube_period.index.get_level_values('componentName').unique())
+        pivots[period] = engine.Building_pivot(cube_period, components)
+    return pivots
+
+
+def Building_figures(cube_period):
+    specs = []
+    for component in cube_period.index.get_level_values('componentName').unique():
+        cube_component = cube_period.xs(component, level='componentName')
+        for chart in ('map', 'bar'):
+            specs.append(engine.Building_component_figure(cube_component, component, chart, component))
+    return specs
+
+
+def Benchmarking(datasets, scale, page_size=None):
+    results = []
+    stub = ODataStub(Scaling(datasets, scale), page_size=page_size)
+    api.API_BASE_URL = stub.start()
+    # The stand-in has no World Bank endpoint; the groupings stay empty
+    worldbank.WORLDBANK_URL = ''
+    session = engine.Creating_session()
+    # Snapshots go to a throwaway directory so every scale pays the full load
+    snapshot_dir = tempfile.TemporaryDirectory()
+    snapshots.SNAPSHOT_DIR = snapshot_dir.name
+    try:
+        payloads = Measuring(results, scale, 'fetch', Fetching_raw, session)
+        results[-1]['bytes'] = sum(len(payload) for payload in payloads.values())
+        tables = Measuring(results, scale, 'decode', Decoding, payloads)
+        results[-1]['rows'] = len(tables['Allocations'])
+        # Full loader path (paging, concurrency, snapshot writes) for reference
+        Measuring(results, scale, 'load (engine)', engine.Loading_API_All, session)
+        snapshot_key, df_combined = Measuring(results, scale, 'merge', Merging, tables)
+        cube, _ = Measuring(results, scale, 'aggregate', Aggregating, df_combined)
+        pivots = Measuring(results, scale, 'pivot', Pivoting, cube)
+        latest_period = df_combined['Allocation period'].cat.categories[-1]
+        features = pivots[latest_period].iloc[:, 1:].to_numpy()
+        Measuring(results, scale, 'elbow + k-means', engine.Clustering_engine, features)
+        specs = Measuring(results, scale, 'figures', Building_figures, cube.xs(latest_period, level='Allocation period'))
+        results[-1]['bytes'] = sum(len(spec) for spec in specs)
+    finally:
+        stub.stop()
+        snapshot_dir.cleanup()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100], help='row-count multipliers (default: 1 10 100)')
+    parser.add_argument('--recordings', default=DEFAULT_DIR, help='recorded responses (default: synthetic data when missing)')
+    parser.add_argument('--page-size', type=int, help='server-side page size of the stand-in (default: no paging)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    datasets = Loading_recordings(args.recordings)
+    if datasets is None:
+        print('No recordings in {}, using synthetic data'.format(args.recordings), file=sys.stderr)
+        datasets = Generating_base()
+
+    results = []
+    for scale in args.scale:
+        results.extend(Benchmarking(datasets, scale, args.page_size))
+
+    print(pd.DataFrame(results).fillna('').to_string(index=False))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Synthetic Global Fund datasets shaped like the API entity sets, and their scale-ups."""
+import random
+
+PERIODS = [(2014, 2016), (2017, 2019), (2020, 2022), (2023, 2025)]
+COMPONENTS = ['HIV/AIDS', 'Tuberculosis', 'Malaria', 'RSSH', 'Multicomponent']
+REGIONS = ['Africa', 'Asia', 'Eastern Europe and Central Asia', 'Latin America and Caribbean', 'Middle East', 'Oceania']
+
+
+def Generating_base(countries=130, multicountries=12, seed=0):
+    # Roughly the size of the live tables: one allocation per country, cycle and funded component
+    rng = random.Random(seed)
+    levels = [
+        {'geographicAreaLevelId': 1, 'geographicAreaLevelName': 'World'},
+        {'geographicAreaLevelId': 2, 'geographicAreaLevelName': 'Region'},
+        {'geographicAreaLevelId': 3, 'geographicAreaLevelName': 'Country'},
+    ]
+    areas = [{'geographicAreaId': 1, 'geographicAreaCode_ISO3': None, 'geographicAreaLevelId': 1,
+              'geographicAreaName': 'World', 'geographicAreaParentId': None}]
+    for i, region in enumerate(REGIONS):
+        areas.append({'geographicAreaId': 10 + i, 'geographicAreaCode_ISO3': None, 'geographicAreaLevelId': 2,
+                      'geographicAreaName': region, 'geographicAreaParentId': 1})
+    for i in range(countries):
+        areas.append({'geographicAreaId': 100 + i, 'geographicAreaCode_ISO3': 'C{:02d}'.format(i),
+                      'geographicAreaLevelId': 3, 'geographicAreaName': 'Country {}'.format(i),
+                      'geographicAreaParentId': 10 + i % len(REGIONS)})
+
+    components = [{'componentId': i + 1, 'componentName': name} for i, name in enumerate(COMPONENTS)]
+    multicountry_list = [{'multiCountryName': 'Multicountry {}'.format(i), 'geographicAreaId': 10 + i % len(REGIONS)}
+                         for i in range(multicountries)]
+
+    allocations = []
+    for start, end in PERIODS:
+        for area in areas[1 + len(REGIONS):]:
+            for component in components[:3]:
+                if rng.random() < 0.7:
+                    allocations.append({'geographicAreaId': area['geographicAreaId'], 'multiCountryName': None,
+                                        'componentId': component['componentId'], 'periodStartYear': start,
+                                        'periodEndYear': end, 'allocationAmount': round(rng.lognormvariate(16, 1.2), 2)})
+        for multicountry in multicountry_list:
+            allocations.append({'geographicAreaId': None, 'multiCountryName': multicountry['multiCountryName'],
+                                'componentId': rng.choice(components)['componentId'], 'periodStartYear': start,
+                                'periodEndYear': end, 'allocationAmount': round(rng.lognormvariate(15, 1), 2)})
+    for i, allocation in enumerate(allocations):
+        allocation['allocationId'] = i + 1
+
+    return {
+        'Allocations': allocations,
+        'GeographicAreas': areas,
+        'GeographicAreaLevels': levels,
+        'Components': components,
+        'MultiCountries': multicountry_list,
+    }
+
+
+def Scaling(datasets, factor, seed=0):
+    # Copies the country-level areas and their allocations factor times (new ids, names and amounts),
+    # so both the row count and the number of locations grow with the factor
+    if factor <= 1:
+        return datasets
+    rng = random.Random(seed)
+    countries = [area for area in datasets['GeographicAreas'] if area['geographicAreaCode_ISO3']]
+    max_area_id = max(area['geographicAreaId'] for area in datasets['GeographicAreas'])
+    max_allocation_id = max(allocation['allocationId'] for allocation in datasets['Allocations'])
+    allocations_by_area = {}
+    for allocation in datasets['Allocations']:
+        allocations_by_area.setdefault(allocation['geographicAreaId'], []).append(allocation)
+
+    areas = list(datasets['GeographicAreas'])
+    allocations = list(datasets['Allocations'])
+    for copy in range(1, factor):
+        for area in countries:
+            max_area_id += 1
+            areas.append(dict(area, geographicAreaId=max_area_id,
+                              geographicAreaName='{} #{}'.format(area['geographicAreaName'], copy)))
+            for allocation in allocations_by_area.get(area['geographicAreaId'], []):
+                max_allocation_id += 1
+                allocations.append(dict(allocation, allocationId=max_allocation_id, geographicAreaId=max_area_id,
+                                        allocationAmount=round(allocation['allocationAmount'] * rng.uniform(0.5, 1.5), 2)))
+    return dict(datasets, GeographicAreas=areas, Allocations=allocations)
@@ -0,0 +1,51 @@
+import pytest
+import requests
+
+from allocations_engine import client
+from allocations_engine.client import BREAKERS, CircuitOpen, Requesting
+
+
+class Session:
+    # Stands in for requests.Session: raises the given error on every get
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(client, 'BACKOFF_BASE', 0)
+    monkeypatch.setattr(client, 'BREAKER_THRESHOLD', 2)
+    monkeypatch.setattr(client, 'BREAKER_COOLDOWN', 60)
+    BREAKERS.clear()
+
+
+def test_retries_then_opens_and_fails_fast():
+    session = Session(requests.Timeout())
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            Requesting(session, 'http://upstream/Allocations', retries=1)
+    assert session.calls == 4
+    assert BREAKERS['upstream']['state'] == 'open'
+
+    with pytest.raises(CircuitOpen):
+        Requesting(session, 'http://upstream/Allocations')
+    assert session.calls == 4
+
+
+def test_failed_trial_with_any_exception_reopens_the_breaker(monkeypatch):
+    BREAKERS['upstream'] = {'state': 'open', 'failures': 2, 'opened_at': 0, 'trial_at': None}
+    with pytest.raises(RuntimeError):
+        Requesting(Session(RuntimeError()), 'http://upstream/Allocations', retries=0)
+    assert BREAKERS['upstream']['state'] == 'open'
+
+
+def test_stale_half_open_lets_a_new_trial_through():
+    BREAKERS['upstream'] = {'state': 'half-open', 'failures': 2, 'opened_at': None, 'trial_at': 0}
+    assert client.Breaker_allowing('upstream')
+    # The new trial is the only one let through
+    assert not client.Breaker_allowing('upstream')
@@ -0,0 +1,39 @@
+import os
+
+import pandas as pd
+import pytest
+
+from allocations_engine import api, snapshots, worldbank
+from allocations_engine.export import Exporting_all
+from benchmarks.odata_stub import ODataStub
+from benchmarks.synthetic import Generating_base
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = ODataStub(Generating_base(countries=20, multicountries=2))
+    monkeypatch.setattr(api, 'API_BASE_URL', stub.start())
+    monkeypatch.setattr(worldbank, 'WORLDBANK_URL', '')
+    yield stub
+    stub.stop()
+
+
+def Exporting(directory, monkeypatch, copy_on_write):
+    # A fresh snapshot directory, so each run loads from the stand-in
+    monkeypatch.setattr(snapshots, 'SNAPSHOT_DIR', os.path.join(directory, 'snapshots'))
+    with pd.option_context('mode.copy_on_write', copy_on_write):
+        return Exporting_all(os.path.join(directory, 'out'))
+
+
+def test_export_gives_the_same_tables_with_and_without_copy_on_write(stub, tmp_path, monkeypatch):
+    # The export CLI and the benchmarks run with copy-on-write off; the app turns it on
+    off = Exporting(str(tmp_path / 'off'), monkeypatch, False)
+    on = Exporting(str(tmp_path / 'on'), monkeypatch, True)
+    assert off is not None and on is not None
+    assert off['snapshot_key'] == on['snapshot_key']
+    assert off['files'] == on['files']
+    for name in off['files']:
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(tmp_path / 'off' / 'out' / name),
+            pd.read_parquet(tmp_path / 'on' / 'out' / name)
+        )
@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+from allocations_engine.model import Building_pivot
+
+
+def Cube_period():
+    # Cube cells of one period: HIV in two locations, TB in one, so the pivot has a missing cell
+    index = pd.MultiIndex.from_arrays([
+        pd.Categorical(['HIV', 'HIV', 'TB']),
+        pd.Categorical(['Kenya', 'Peru', 'Kenya']),
+    ], names=['componentName', 'Location'])
+    return pd.DataFrame({'sum': [1.0, 2.0, 3.0], 'count': [1, 1, 1], 'mean': [1.0, 2.0, 3.0]}, index=index)
+
+
+@pytest.mark.parametrize('copy_on_write', [False, True])
+def test_pivot_fills_missing_cells_with_zero(copy_on_write):
+    with pd.option_context('mode.copy_on_write', copy_on_write):
+        df_pivot = Building_pivot(Cube_period(), ['HIV', 'TB'])
+    assert list(df_pivot.columns) == ['Location', 'HIV', 'TB']
+    assert df_pivot.set_index('Location').to_dict('index') == {'Kenya': {'HIV': 1.0, 'TB': 3.0}, 'Peru': {'HIV': 2.0, 'TB': 0.0}}
+
+
+@pytest.mark.parametrize('copy_on_write', [False, True])
+def test_pivot_by_world_bank_grouping_leaves_out_unclassified_locations(copy_on_write):
+    cube_period = Cube_period()
+    regions = pd.Categorical(cube_period.index.get_level_values('Location').map({'Kenya': 'Sub-Saharan Africa'}))
+    cube_period = cube_period.set_index(pd.Index(regions, name='wbRegion'), append=True)
+    with pd.option_context('mode.copy_on_write', copy_on_write):
+        df_pivot = Building_pivot(cube_period, ['HIV', 'TB'], by='wbRegion')
+    assert df_pivot.set_index('wbRegion').to_dict('index') == {'Sub-Saharan Africa': {'HIV': 1.0, 'TB': 3.0}}
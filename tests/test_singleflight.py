@@ -0,0 +1,53 @@
+import time
+import threading
+
+from allocations_engine import singleflight
+from allocations_engine.singleflight import Coalescing
+
+
+def test_concurrent_callers_share_one_fetch():
+    calls, results = [], []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return object()
+
+    threads = [threading.Thread(target=lambda: results.append(Coalescing('test shared', fetch))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_success_is_not_kept_after_the_flight():
+    calls = []
+    Coalescing('test success', lambda: calls.append(1) or 'value')
+    Coalescing('test success', lambda: calls.append(1) or 'value')
+    assert len(calls) == 2
+
+
+def test_failure_is_kept_for_the_failure_ttl(monkeypatch):
+    calls = []
+    assert Coalescing('test failure', lambda: calls.append(1)) is None
+    assert Coalescing('test failure', lambda: calls.append(1)) is None
+    assert len(calls) == 1
+
+    monkeypatch.setattr(singleflight, 'FAILURE_TTL', 0)
+    Coalescing('test failure', lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_exception_reaches_the_waiting_callers():
+    def fetch():
+        raise ValueError('upstream')
+
+    for _ in range(2):
+        try:
+            Coalescing('test exception', fetch)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('expected ValueError')
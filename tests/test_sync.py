@@ -0,0 +1,25 @@
+import pandas as pd
+
+from allocations_engine.sync import Merging_delta
+
+
+def Allocations(*cycles):
+    # One row per (periodStartYear, allocationAmount)
+    return pd.DataFrame(cycles, columns=['periodStartYear', 'allocationAmount'])
+
+
+def test_empty_delta_keeps_the_history():
+    history = Allocations((2020, 1.0), (2023, 2.0))
+    assert Merging_delta(history, Allocations(), 2023) is history
+
+
+def test_delta_without_the_newest_cycle_keeps_its_rows_and_appends_later_cycles():
+    history = Allocations((2020, 1.0), (2023, 2.0))
+    merged = Merging_delta(history, Allocations((2026, 3.0)), 2023)
+    assert merged.values.tolist() == [[2020, 1.0], [2023, 2.0], [2026, 3.0]]
+
+
+def test_newest_cycle_is_replaced_when_the_delta_has_it():
+    history = Allocations((2020, 1.0), (2023, 2.0), (2023, 4.0))
+    merged = Merging_delta(history, Allocations((2023, 5.0), (2026, 3.0)), 2023)
+    assert merged.values.tolist() == [[2020, 1.0], [2023, 5.0], [2026, 3.0]]